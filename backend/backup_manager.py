@@ -12,6 +12,8 @@ import logging
 import zipfile
 import tempfile
 
+from update_manager import update_manager, BACKUP_SUFFIX, BACKUP_MANIFEST
+
 logger = logging.getLogger(__name__)
 
 class BackupManager:
@@ -379,6 +381,13 @@ class BackupManager:
             
             logger.info(f"Restoring from backup: {backup_name}")
             
+            # Update backups are single tarballs
+            if os.path.isfile(backup_path):
+                if not update_manager.extract_backup(backup_path, skip_files=('.env',)):
+                    return False
+                logger.info("✓ Backup restored successfully")
+                return True
+            
             # SAFE: Overlay files (don't delete existing infrastructure)
             if os.path.exists(f"{backup_path}/backend"):
                 for root, dirs, files in os.walk(f"{backup_path}/backend"):
@@ -423,7 +432,25 @@ class BackupManager:
             backups = []
             for item in os.listdir(self.backup_dir):
                 backup_path = f"{self.backup_dir}/{item}"
-                if os.path.isdir(backup_path):
+                if item.endswith(BACKUP_SUFFIX) and os.path.isfile(backup_path):
+                    # Update backup tarball; size and date come from its manifest sidecar
+                    stat = os.stat(backup_path)
+                    manifest = {}
+                    try:
+                        with open(f"{backup_path}.{BACKUP_MANIFEST}", 'r') as f:
+                            manifest = json.load(f)
+                    except (OSError, ValueError):
+                        pass
+                    
+                    backups.append({
+                        "name": item,
+                        "path": backup_path,
+                        "type": "auto",
+                        "description": "",
+                        "created": manifest.get("created") or datetime.fromtimestamp(stat.st_ctime).isoformat(),
+                        "size_mb": round(manifest.get("size_bytes", stat.st_size) / (1024 * 1024), 2)
+                    })
+                elif os.path.isdir(backup_path):
                     stat = os.stat(backup_path)
                     
                     # Try to load metadata
@@ -458,7 +485,11 @@ class BackupManager:
             if not os.path.exists(backup_path):
                 raise Exception(f"Backup not found: {backup_name}")
             
-            shutil.rmtree(backup_path)
+            if os.path.isfile(backup_path):
+                # Update backup tarball plus its manifest sidecar
+                update_manager.delete_backup(backup_path)
+            else:
+                shutil.rmtree(backup_path)
             logger.info(f"✓ Backup deleted: {backup_name}")
             return True
             
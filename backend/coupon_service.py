@@ -106,3 +106,30 @@ class CouponService:
             "usage_count": usage_count,
             "total_discount": total_discount
         }
+    
+    async def get_all_coupons_with_stats(self):
+        """Get all coupons with usage statistics joined in a single aggregation"""
+        pipeline = [
+            {"$sort": {"created_at": -1}},
+            {"$lookup": {
+                "from": self.coupon_usage.name,
+                "let": {"coupon_id": {"$toString": "$_id"}},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$coupon_id", "$$coupon_id"]}}},
+                    {"$project": {"_id": 0, "discount_amount": 1}}
+                ],
+                "as": "_usages"
+            }},
+            {"$addFields": {
+                "usage_count": {"$size": "$_usages"},
+                "total_discount": {"$sum": "$_usages.discount_amount"}
+            }},
+            {"$project": {"_usages": 0}}
+        ]
+        
+        coupons = []
+        async for coupon in self.coupons.aggregate(pipeline):
+            coupon["id"] = str(coupon.pop("_id"))
+            coupons.append(coupon)
+        
+        return coupons
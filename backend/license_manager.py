@@ -3,9 +3,14 @@ import secrets
 import string
 import logging
 import os
+import time
 
 logger = logging.getLogger(__name__)
 
+# How long remote validation results are reused (seconds)
+VALID_LICENSE_CACHE_TTL = 300
+INVALID_LICENSE_CACHE_TTL = 30
+
 class LicenseManager:
     """Manage application licensing"""
     
@@ -13,6 +18,8 @@ class LicenseManager:
         self.db = db
         self.licenses = db.licenses
         self.validations = db.license_validations
+        # (license_key, domain, ip_address) -> (expires_at, result)
+        self._validation_cache = {}
     
     def generate_license_key(self) -> str:
         """Generate a unique license key (format: XXXX-XXXX-XXXX-XXXX)"""
@@ -69,8 +76,24 @@ class LicenseManager:
         
         return license_key
     
+    def clear_validation_cache(self):
+        """Forget cached remote validation results"""
+        self._validation_cache.clear()
+    
     async def validate_license(self, license_key: str, domain: str, ip_address: str = None) -> dict:
-        """Validate a license key - calls remote license server"""
+        """Validate a license key - calls remote license server (results cached briefly)"""
+        cache_key = (license_key, domain, ip_address)
+        cached = self._validation_cache.get(cache_key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        
+        result = await self._validate_license_remote(license_key, domain, ip_address)
+        ttl = VALID_LICENSE_CACHE_TTL if result.get("valid") else INVALID_LICENSE_CACHE_TTL
+        self._validation_cache[cache_key] = (time.monotonic() + ttl, result)
+        return result
+    
+    async def _validate_license_remote(self, license_key: str, domain: str, ip_address: str = None) -> dict:
+        """Validate a license key against the remote license server"""
         import aiohttp
         
         # Remote license server URL
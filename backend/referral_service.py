@@ -196,6 +196,29 @@ class ReferralService:
             referrals.append(ref)
         return referrals
     
+    async def get_user_referral_summary(self, user_id: str) -> dict:
+        """Get referral counts and earned rewards for a user in one aggregation"""
+        pipeline = [
+            {"$match": {"referrer_id": user_id}},
+            {"$group": {
+                "_id": None,
+                "total_referrals": {"$sum": 1},
+                "completed_referrals": {
+                    "$sum": {"$cond": [{"$eq": ["$status", "completed"]}, 1, 0]}
+                },
+                "total_earned": {
+                    "$sum": {"$cond": [{"$eq": ["$rewarded", True]}, {"$ifNull": ["$reward_amount", 0]}, 0]}
+                }
+            }}
+        ]
+        
+        summary = {"total_referrals": 0, "completed_referrals": 0, "total_earned": 0}
+        async for result in self.referrals.aggregate(pipeline):
+            result.pop("_id", None)
+            summary.update(result)
+        
+        return summary
+    
     async def get_leaderboard(self, limit: int = 10):
         """Get top referrers"""
         pipeline = [
@@ -1,20 +1,27 @@
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, status, Query, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, ORJSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel, EmailStr
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime, timedelta
-from typing import List, Optional
+from dateutil.relativedelta import relativedelta
+from typing import Dict, List, Optional, Tuple
 import os
 import logging
-import uuid
-import aiofiles
 import random
 import string
 import secrets
 import asyncio
+import concurrent.futures
+import copy
+import functools
+import httpx
+import orjson
 import re
+import time
 import shutil
 from bson import ObjectId
 from dotenv import load_dotenv
@@ -50,7 +57,7 @@ from auth import (
     get_current_user, get_current_admin_user
 )
 from xtreamui_service import get_xtream_service, XtreamUIService
-from xtream_session_client import XtreamUISessionClient
+from xtream_session_client import AsyncXtreamUISessionClient, XtreamUISessionClient
 from onestream_service import OneStreamService, get_onestream_service
 from email_service import get_email_service
 from email_logger import EmailLogger
@@ -66,7 +73,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI
-app = FastAPI(title="IPTV Billing System", version="1.0.0")
+app = FastAPI(title="IPTV Billing System", version="1.0.0", default_response_class=ORJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -80,7 +87,8 @@ app.add_middleware(
 # MongoDB connection
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/iptv_billing")
 DB_NAME = os.getenv("DB_NAME", "test_database")
-client = AsyncIOMotorClient(MONGO_URL)
+# Pool sized for the gather() fan-out used by refund/subscriber endpoints
+client = AsyncIOMotorClient(MONGO_URL, maxPoolSize=200, minPoolSize=20, maxIdleTimeMS=60000)
 db = client[DB_NAME]
 
 # Collections
@@ -163,20 +171,57 @@ def generate_password(length: int = 9) -> str:
     characters = 'abcdefghjkmnpqrstuvwxyzABCDEFGHJKMNPQRSTUVWXYZ23456789'
     return ''.join(random.choices(characters, k=length))
 
+# Short-lived in-process cache of the settings document. Every handler that
+# writes to settings_collection must call invalidate_settings_cache().
+SETTINGS_CACHE_TTL = 5.0
+_settings_cache: dict = {"value": None, "expires": 0.0, "generation": 0}
+
+def invalidate_settings_cache():
+    """Force the next get_settings() call to read from MongoDB"""
+    _settings_cache["value"] = None
+    _settings_cache["expires"] = 0.0
+    _settings_cache["generation"] += 1
+
+# Dedicated pool for blocking panel HTTP calls (the panel clients use requests),
+# so they neither stall the event loop nor compete with the default executor.
+_PANEL_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="panel")
+
+# Shared async HTTP client for panel API calls that have async variants (created on startup).
+# Panels are commonly self-signed, matching the services' ssl_verify=False default.
+panel_http_client: Optional[httpx.AsyncClient] = None
+
+async def run_panel_call(func, *args, **kwargs):
+    """Run a blocking panel client call in the panel thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_PANEL_EXECUTOR, functools.partial(func, *args, **kwargs))
+
 async def get_settings() -> dict:
-    """Get system settings"""
+    """Get system settings (cached for SETTINGS_CACHE_TTL seconds)"""
+    if _settings_cache["value"] is not None and time.monotonic() < _settings_cache["expires"]:
+        # Callers mutate the returned dict, so hand out a copy
+        return copy.deepcopy(_settings_cache["value"])
+    
+    generation = _settings_cache["generation"]
     settings = await settings_collection.find_one()
     if not settings:
         # Create default settings
-        default_settings = Settings().dict()
-        await settings_collection.insert_one(default_settings)
-        return default_settings
+        settings = Settings().dict()
+        await settings_collection.insert_one(settings)
+    
+    # Don't cache a read that raced with a write
+    if generation == _settings_cache["generation"]:
+        _settings_cache["value"] = copy.deepcopy(settings)
+        _settings_cache["expires"] = time.monotonic() + SETTINGS_CACHE_TTL
     return settings
 
+# Set at startup once the unique coupons.code index exists; until then create_coupon checks for duplicates itself
+_coupon_code_index_ready = False
+
 # Startup event
 @app.on_event("startup")
 async def startup_event():
     """Initialize application"""
+    global _coupon_code_index_ready
     logger.info("Starting IPTV Billing System...")
     
     # Create indexes
@@ -184,6 +229,32 @@ async def startup_event():
     await products_collection.create_index("name")
     await orders_collection.create_index("user_id")
     await services_collection.create_index("user_id")
+    await asyncio.gather(
+        services_collection.create_index("order_id"),
+        services_collection.create_index([("status", 1), ("panel_type", 1)]),
+        refunds_collection.create_index([("order_id", 1), ("status", 1)]),
+        refunds_collection.create_index([("requested_at", -1)])
+    )
+    await downloads_collection.create_index([("active", 1), ("category", 1)])
+    await download_logs_collection.create_index([("download_id", 1), ("downloaded_at", -1)])
+    # Backs the coupon stats $lookup and per-coupon usage counts
+    await coupon_usage_collection.create_index("coupon_id")
+    await imported_users_collection.create_index(
+        [("panel_index", 1), ("panel_type", 1), ("username", 1), ("account_type", 1)]
+    )
+    try:
+        await coupons_collection.create_index("code", unique=True)
+        _coupon_code_index_ready = True
+    except Exception as e:
+        logger.warning(f"Could not create unique coupon code index (duplicate codes?): {e}")
+    try:
+        await unsubscribe_manager.ensure_indexes()
+    except Exception as e:
+        logger.warning(f"Could not create email unsubscribe indexes: {e}")
+    try:
+        await unsubscribe_manager.load_unsubscribed_all()
+    except Exception as e:
+        logger.warning(f"Could not preload unsubscribed emails: {e}")
     
     # Create default admin user if not exists
     admin_exists = await users_collection.find_one({"role": "admin"})
@@ -696,6 +767,14 @@ async def startup_event():
         await email_templates_collection.insert_many(default_templates)
         logger.info("Default email templates created")
     
+    # Shared connection pool for async panel API calls
+    global panel_http_client
+    panel_http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        timeout=30,
+        verify=False
+    )
+    
     # Initialize lifecycle manager and background jobs
     global lifecycle_manager, background_scheduler
     
@@ -717,6 +796,12 @@ async def startup_event():
     
     logger.info("IPTV Billing System started successfully!")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared connections"""
+    if panel_http_client is not None:
+        await panel_http_client.aclose()
+
 # Health check
 @app.get("/api/health")
 async def health_check():
@@ -4012,6 +4097,7 @@ async def update_admin_settings(settings_update: Settings,
         )
     else:
         await settings_collection.insert_one(settings_dict)
+    invalidate_settings_cache()
     
     # Reinitialize services with new settings
     get_xtream_service(settings_dict.get("xtream", {}))
@@ -4068,6 +4154,7 @@ async def update_telegram_settings(telegram: TelegramSettings, current_user: dic
         {"$set": {"notifications": settings["notifications"]}},
         upsert=True
     )
+    invalidate_settings_cache()
     
     return {"message": "Telegram settings updated successfully"}
 
@@ -4283,6 +4370,7 @@ async def sync_xuione_bouquets(panel_index: int = 0, current_user: dict = Depend
         {"$set": {"xuione": settings["xuione"]}},
         upsert=True
     )
+    invalidate_settings_cache()
     
     return {
         "message": f"Synced {len(bouquets)} bouquets from {panel_name}",
@@ -4531,6 +4619,7 @@ async def sync_onestream_bouquets(panel_index: int = 0, current_user: dict = Dep
         settings["onestream"] = {"panels": panels}
     settings["onestream"]["panels"][panel_index]["bouquets"] = result["bouquets"]
     await db.settings.update_one({}, {"$set": {"onestream": settings["onestream"]}})
+    invalidate_settings_cache()
     return {"bouquets": result["bouquets"], "count": len(result["bouquets"])}
 
 
@@ -4868,8 +4957,28 @@ async def test_email_template(
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads", "attachments")
 HERO_IMAGES_DIR = os.path.join(BASE_DIR, "uploads", "hero")
+DOWNLOADS_DIR = os.path.join(BASE_DIR, "uploads", "downloads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(HERO_IMAGES_DIR, exist_ok=True)
+os.makedirs(DOWNLOADS_DIR, exist_ok=True)
+
+def _write_bytes(path: str, data: bytes) -> None:
+    """Write an uploaded file to disk (run via asyncio.to_thread)"""
+    with open(path, 'wb') as f:
+        f.write(data)
+
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+def _unique_upload_filename(filename: str, prefix: str = "") -> str:
+    """Random stored filename keeping a bounded, lower-cased copy of the original extension"""
+    file_extension = os.path.splitext(filename)[1].lower()[:10]
+    return f"{prefix}{secrets.token_urlsafe(16)}{file_extension}"
+
+def _write_all(fd: int, data: bytes) -> None:
+    """Write a whole chunk to a raw file descriptor (os.write may be partial)"""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
 
 @app.post("/api/admin/upload/hero-image")
 async def upload_hero_image(
@@ -4893,13 +5002,11 @@ async def upload_hero_image(
         raise HTTPException(status_code=400, detail="File too large. Maximum size is 5MB")
     
     # Generate unique filename
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"hero_{uuid.uuid4()}{file_extension}"
+    unique_filename = _unique_upload_filename(file.filename, prefix="hero_")
     file_path = os.path.join(HERO_IMAGES_DIR, unique_filename)
     
     # Save file
-    async with aiofiles.open(file_path, 'wb') as f:
-        await f.write(contents)
+    await asyncio.to_thread(_write_bytes, file_path, contents)
     
     # Return file info
     return {
@@ -4926,13 +5033,11 @@ async def upload_attachment(
         raise HTTPException(status_code=400, detail="File too large. Maximum size is 10MB")
     
     # Generate unique filename
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
+    unique_filename = _unique_upload_filename(file.filename)
     file_path = os.path.join(UPLOAD_DIR, unique_filename)
     
     # Save file
-    async with aiofiles.open(file_path, 'wb') as f:
-        await f.write(contents)
+    await asyncio.to_thread(_write_bytes, file_path, contents)
     
     # Return file info
     return {
@@ -4961,7 +5066,6 @@ async def delete_attachment(filename: str, current_user: dict = Depends(get_curr
 UPLOAD_BASE_DIR = os.path.dirname(os.path.abspath(__file__)) + "/uploads"
 os.makedirs(UPLOAD_BASE_DIR, exist_ok=True)
 os.makedirs(f"{UPLOAD_BASE_DIR}/attachments", exist_ok=True)
-os.makedirs(f"{UPLOAD_BASE_DIR}/downloads", exist_ok=True)
 
 app.mount("/api/uploads", StaticFiles(directory=UPLOAD_BASE_DIR), name="uploads")
 
@@ -5308,6 +5412,7 @@ async def sync_bouquets_from_panel(panel_index: int = 0, current_user: dict = De
                 {"$set": {f"bouquets_panel_{panel_index}": bouquets, "updated_at": datetime.utcnow()}},
                 upsert=True
             )
+            invalidate_settings_cache()
             
             return {
                 "success": True,
@@ -5340,15 +5445,19 @@ async def sync_packages_from_panel(panel_index: int = 0, current_user: dict = De
     panel = panels[panel_index]
     
     try:
-        client = XtreamUISessionClient(
+        client = AsyncXtreamUISessionClient(
             panel_url=panel["panel_url"],
             username=panel["admin_username"],
             password=panel["admin_password"]
         )
         
         # Fetch BOTH regular and trial packages
-        regular_packages = client.fetch_packages()
-        trial_packages = client.fetch_trial_packages()
+        try:
+            regular_packages, trial_packages = await asyncio.gather(
+                client.fetch_packages(), client.fetch_trial_packages()
+            )
+        finally:
+            await client.close()
         
         # Combine packages with type indicator
         all_packages = []
@@ -5398,13 +5507,16 @@ async def sync_trial_packages_from_panel(panel_index: int = 0, current_user: dic
     panel = panels[panel_index]
     
     try:
-        client = XtreamUISessionClient(
+        client = AsyncXtreamUISessionClient(
             panel_url=panel["panel_url"],
             username=panel["admin_username"],
             password=panel["admin_password"]
         )
         
-        trial_packages = client.fetch_trial_packages()
+        try:
+            trial_packages = await client.fetch_trial_packages()
+        finally:
+            await client.close()
         
         return {
             "success": True,
@@ -5498,8 +5610,11 @@ async def sync_all_users_from_all_panels(current_user: dict = Depends(get_curren
             synced_count = 0
             updated_count = 0
             
-            # Sync subscribers using get_reseller_users()
-            users_result = xtream_service.get_reseller_users()
+            # Fetch subscribers and resellers together over one panel login
+            accounts = await run_panel_call(xtream_service.get_all_accounts)
+            
+            # Sync subscribers
+            users_result = accounts["users"]
             if users_result.get("success"):
                 users = users_result.get("users", [])
                 for user_data in users:
@@ -5556,8 +5671,8 @@ async def sync_all_users_from_all_panels(current_user: dict = Depends(get_curren
                         await imported_users_collection.insert_one(user_doc)
                         synced_count += 1
             
-            # Sync resellers using get_subresellers()
-            resellers_result = xtream_service.get_subresellers()
+            # Sync resellers
+            resellers_result = accounts["resellers"]
             if resellers_result.get("success"):
                 resellers = resellers_result.get("users", [])
                 for reseller_data in resellers:
@@ -5891,8 +6006,11 @@ async def sync_users_from_panel(panel_index: int = 0, current_user: dict = Depen
     xtream_subscriber_usernames = set()
     xtream_reseller_usernames = set()
     
+    # Fetch the users and reg_users tables together over one panel login
+    accounts = await run_panel_call(xtream_service.get_all_accounts)
+    
     # === SYNC SUBSCRIBERS (users table) ===
-    result = xtream_service.get_reseller_users()
+    result = accounts["users"]
     
     if result.get("success"):
         users_data = result.get("users", [])
@@ -5959,7 +6077,7 @@ async def sync_users_from_panel(panel_index: int = 0, current_user: dict = Depen
                 synced_count += 1
     
     # === SYNC SUBRESELLERS (reg_users table) ===
-    reseller_result = xtream_service.get_subresellers()
+    reseller_result = accounts["resellers"]
     reseller_synced = 0
     reseller_updated = 0
     
@@ -6319,11 +6437,15 @@ async def check_for_updates(current_user: dict = Depends(get_current_admin_user)
 async def apply_update(current_user: dict = Depends(get_current_admin_user)):
     """Apply available updates with backup"""
     try:
-        # Create backup first
-        backup_path = update_manager.create_backup()
+        # Backup + apply under the update lock (no-op when already at the latest commit)
+        result = update_manager.run_update()
         
-        # Apply update
-        result = update_manager.apply_update(backup_path)
+        if result.get("noop"):
+            return {
+                "message": "Already up to date",
+                "success": True,
+                "noop": True
+            }
         
         if result.get("success"):
             # Return success response first
@@ -6375,8 +6497,7 @@ async def delete_backup(backup_name: str, current_user: dict = Depends(get_curre
         raise HTTPException(status_code=404, detail="Backup not found")
     
     try:
-        import shutil
-        shutil.rmtree(backup_path)
+        update_manager.delete_backup(backup_path)
         logger.info(f"✓ Deleted backup: {backup_name}")
         return {"message": f"Backup {backup_name} deleted successfully"}
     except Exception as e:
@@ -6550,6 +6671,10 @@ async def download_backup(backup_name: str, current_user: dict = Depends(get_cur
     if not os.path.exists(backup_path):
         raise HTTPException(status_code=404, detail="Backup not found")
     
+    # Update backups are already a single compressed tarball
+    if os.path.isfile(backup_path):
+        return FileResponse(backup_path, media_type='application/gzip', filename=backup_name)
+    
     # Create temporary ZIP file
     temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
     temp_zip_path = temp_zip.name
@@ -6849,12 +6974,77 @@ class CreateImportedUserRequest(BaseModel):
     member_group_id: Optional[int] = 2
 
 
-@app.post("/api/admin/imported-users/create")
-async def create_imported_user(data: CreateImportedUserRequest, current_user: dict = Depends(get_current_admin_user)):
-    """Create a new user directly on the panel and add to imported_users collection"""
+# Short-lived cache of panel package details used by manual user creation.
+# Keyed by (panel_type, panel_index, package_id) -> (expires_at, duration_months, max_connections)
+_package_cache: dict = {}
+
+
+def _parse_package_duration(pkg: dict) -> tuple:
+    """Return (duration_months, max_connections) parsed from a panel package"""
+    duration_val = pkg.get("duration", "1")
+    duration_unit = pkg.get("duration_unit", "months")
+    try:
+        duration = int(duration_val)
+        # Convert to months if needed
+        if duration_unit == "days":
+            duration = max(1, duration // 30)
+        elif duration_unit == "years":
+            duration = duration * 12
+    except (ValueError, TypeError):
+        duration = 1
     
-    settings = await get_settings()
+    try:
+        max_connections = int(pkg.get("max_connections", "1"))
+    except (ValueError, TypeError):
+        max_connections = 1
     
+    return duration, max_connections
+
+
+async def _resolve_package(panel_type: str, panel_index: int, service, package_id, ttl: int = 60) -> tuple:
+    """Return (duration_months, max_connections) for a panel package, using a short TTL cache"""
+    key = (panel_type, panel_index, str(package_id))
+    cached = _package_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1], cached[2]
+    
+    package_duration = 1  # Default 1 month
+    package_max_connections = 1  # Default 1 connection
+    
+    try:
+        # Get packages from panel and cache all of them, not just the requested one
+        packages_result = await run_panel_call(service.get_packages)
+        if packages_result.get("success"):
+            expires_at = time.monotonic() + ttl
+            for pkg in packages_result.get("packages", []):
+                duration, max_connections = _parse_package_duration(pkg)
+                _package_cache[(panel_type, panel_index, str(pkg.get("id")))] = (expires_at, duration, max_connections)
+                if str(pkg.get("id")) == str(package_id):
+                    package_duration, package_max_connections = duration, max_connections
+    except Exception as e:
+        logger.warning(f"Could not fetch {panel_type} package details: {e}")
+    
+    return package_duration, package_max_connections
+
+
+def _base_user_doc(panel_index: int, panel_type: str, panel_name: str, username: str,
+                   password: str, account_type: str, now: datetime) -> dict:
+    """Build the fields shared by every manually created imported_users document"""
+    return {
+        "panel_index": panel_index,
+        "panel_type": panel_type,
+        "panel_name": panel_name,
+        "username": username,
+        "password": password,
+        "status": "active",
+        "account_type": account_type,
+        "last_synced": now,
+        "created_at": now
+    }
+
+
+async def _create_panel_user(data: CreateImportedUserRequest, settings: dict, current_user: dict) -> tuple:
+    """Create a user on the panel and return (imported_users document, API response)"""
     # Generate credentials if not provided
     username = data.username or generate_username()
     password = data.password or generate_password()
@@ -6886,42 +7076,16 @@ async def create_imported_user(data: CreateImportedUserRequest, current_user: di
                 raise HTTPException(status_code=400, detail="package_id is required for subscriber creation")
             
             # Fetch package details to get duration and max_connections
-            package_duration = 1  # Default 1 month
-            package_max_connections = 1  # Default 1 connection
-            
-            try:
-                # Get packages from panel to find the selected one
-                packages_result = xtream_service.get_packages()
-                if packages_result.get("success"):
-                    for pkg in packages_result.get("packages", []):
-                        if str(pkg.get("id")) == str(data.package_id):
-                            # Parse duration from package
-                            duration_val = pkg.get("duration", "1")
-                            duration_unit = pkg.get("duration_unit", "months")
-                            try:
-                                package_duration = int(duration_val)
-                                # Convert to months if needed
-                                if duration_unit == "days":
-                                    package_duration = max(1, package_duration // 30)
-                                elif duration_unit == "years":
-                                    package_duration = package_duration * 12
-                            except (ValueError, TypeError):
-                                package_duration = 1
-                            
-                            # Get max connections
-                            try:
-                                package_max_connections = int(pkg.get("max_connections", "1"))
-                            except (ValueError, TypeError):
-                                package_max_connections = 1
-                            break
-            except Exception as e:
-                logger.warning(f"Could not fetch package details: {e}")
+            package_duration, package_max_connections = await _resolve_package(
+                "xtream", panel_index, xtream_service, data.package_id
+            )
             
             # Get bouquets from a product or use all
             bouquets = [1]  # Default bouquet
             
             # Create subscriber using form method
-            result = xtream_service.create_subscriber_via_form(
+            result = await run_panel_call(
+                xtream_service.create_subscriber_via_form,
                 username=username,
                 password=password,
                 package_id=data.package_id,
@@ -6933,28 +7097,19 @@ async def create_imported_user(data: CreateImportedUserRequest, current_user: di
                 raise HTTPException(status_code=500, detail=result.get("error", "Failed to create subscriber on panel"))
             
             # Calculate expiry date using package duration
-            expiry_date = datetime.utcnow() + timedelta(days=package_duration * 30)
+            now = datetime.utcnow()
+            expiry_date = now + relativedelta(months=package_duration)
             
-            # Insert into imported_users collection
-            user_doc = {
-                "panel_index": panel_index,
-                "panel_type": "xtream",
-                "panel_name": panel_name,
+            # Build imported_users document
+            user_doc = _base_user_doc(panel_index, "xtream", panel_name, username, password, "subscriber", now)
+            user_doc.update({
                 "xtream_user_id": int(result.get("user_id", 0)),
-                "username": username,
-                "password": password,
                 "expiry_date": expiry_date,
-                "status": "active",
                 "max_connections": package_max_connections,
-                "account_type": "subscriber",
-                "created_by_reseller": None,
-                "last_synced": datetime.utcnow(),
-                "created_at": datetime.utcnow()
-            }
-            
-            await imported_users_collection.insert_one(user_doc)
+                "created_by_reseller": None
+            })
             
-            return {
+            return user_doc, {
                 "success": True,
                 "message": f"Subscriber '{username}' created successfully on {panel_name}",
                 "user": {
@@ -6970,7 +7125,8 @@ async def create_imported_user(data: CreateImportedUserRequest, current_user: di
         
         else:  # reseller
             # Create reseller
-            result = xtream_service.create_reseller(
+            result = await run_panel_call(
+                xtream_service.create_reseller,
                 username=username,
                 password=password,
                 credits=data.credits or 0.0,
@@ -6981,26 +7137,16 @@ async def create_imported_user(data: CreateImportedUserRequest, current_user: di
             if not result.get("success"):
                 raise HTTPException(status_code=500, detail=result.get("error", "Failed to create reseller on panel"))
             
-            # Insert into imported_users collection
-            user_doc = {
-                "panel_index": panel_index,
-                "panel_type": "xtream",
-                "panel_name": panel_name,
+            # Build imported_users document
+            user_doc = _base_user_doc(panel_index, "xtream", panel_name, username, password, "reseller", datetime.utcnow())
+            user_doc.update({
                 "xtream_user_id": int(result.get("user_id", 0)),
-                "username": username,
-                "password": password,
                 "expiry_date": None,  # Resellers don't expire
-                "status": "active",
                 "credits": data.credits,
-                "account_type": "reseller",
-                "member_group": f"Group {data.member_group_id}",
-                "last_synced": datetime.utcnow(),
-                "created_at": datetime.utcnow()
-            }
-            
-            await imported_users_collection.insert_one(user_doc)
+                "member_group": f"Group {data.member_group_id}"
+            })
             
-            return {
+            return user_doc, {
                 "success": True,
                 "message": f"Reseller '{username}' created successfully on {panel_name}",
                 "user": {
@@ -7042,43 +7188,17 @@ async def create_imported_user(data: CreateImportedUserRequest, current_user: di
             
             # Login first
             if not xuione_service.logged_in:
-                if not xuione_service.login():
+                if not await run_panel_call(xuione_service.login):
                     raise HTTPException(status_code=500, detail="Failed to login to XuiOne panel")
             
             # Fetch package details to get duration and max_connections
-            package_duration = 1  # Default 1 month
-            package_max_connections = 1  # Default 1 connection
-            
-            try:
-                # Get packages from panel to find the selected one
-                packages_result = xuione_service.get_packages()
-                if packages_result.get("success"):
-                    for pkg in packages_result.get("packages", []):
-                        if str(pkg.get("id")) == str(data.package_id):
-                            # Parse duration from package
-                            duration_val = pkg.get("duration", "1")
-                            duration_unit = pkg.get("duration_unit", "months")
-                            try:
-                                package_duration = int(duration_val)
-                                # Convert to months if needed
-                                if duration_unit == "days":
-                                    package_duration = max(1, package_duration // 30)
-                                elif duration_unit == "years":
-                                    package_duration = package_duration * 12
-                            except (ValueError, TypeError):
-                                package_duration = 1
-                            
-                            # Get max connections
-                            try:
-                                package_max_connections = int(pkg.get("max_connections", "1"))
-                            except (ValueError, TypeError):
-                                package_max_connections = 1
-                            break
-            except Exception as e:
-                logger.warning(f"Could not fetch XuiOne package details: {e}")
+            package_duration, package_max_connections = await _resolve_package(
+                "xuione", panel_index, xuione_service, data.package_id
+            )
             
             # Calculate expiry date using package duration
-            expiry_date = datetime.utcnow() + timedelta(days=package_duration * 30)
+            now = datetime.utcnow()
+            expiry_date = now + relativedelta(months=package_duration)
             
             # Use XuiOne API to create line
             api_url = xuione_service.get_api_url()
@@ -7092,7 +7212,8 @@ async def create_imported_user(data: CreateImportedUserRequest, current_user: di
                 'is_isplock': '0'
             }
             
-            response = xuione_service.session.post(
+            response = await run_panel_call(
+                xuione_service.session.post,
                 api_url,
                 params={
                     'api_key': xuione_service.api_key,
@@ -7105,32 +7226,27 @@ async def create_imported_user(data: CreateImportedUserRequest, current_user: di
             if response.status_code != 200:
                 raise HTTPException(status_code=500, detail=f"XuiOne API error: HTTP {response.status_code}")
             
+            # Panels answer errors with an HTML page; reject non-JSON bodies without a parse attempt
+            body = response.content.lstrip()
+            if not body.startswith((b'{', b'[')):
+                raise HTTPException(status_code=500, detail="Invalid response from XuiOne API")
             try:
-                result = response.json()
-                if result.get('status') != 'STATUS_SUCCESS':
-                    raise HTTPException(status_code=500, detail=result.get("message", "Failed to create line"))
-            except ValueError:
+                result = orjson.loads(body)
+            except orjson.JSONDecodeError:
                 raise HTTPException(status_code=500, detail="Invalid response from XuiOne API")
+            if not isinstance(result, dict) or result.get('status') != 'STATUS_SUCCESS':
+                message = result.get("message") if isinstance(result, dict) else None
+                raise HTTPException(status_code=500, detail=message or "Failed to create line")
             
-            # Insert into imported_users collection
-            user_doc = {
-                "panel_index": panel_index,
-                "panel_type": "xuione",
-                "panel_name": panel_name,
+            # Build imported_users document
+            user_doc = _base_user_doc(panel_index, "xuione", panel_name, username, password, "subscriber", now)
+            user_doc.update({
                 "xtream_user_id": result.get("data", {}).get("id", 0),
-                "username": username,
-                "password": password,
                 "expiry_date": expiry_date,
-                "status": "active",
-                "max_connections": package_max_connections,
-                "account_type": "subscriber",
-                "last_synced": datetime.utcnow(),
-                "created_at": datetime.utcnow()
-            }
-            
-            await imported_users_collection.insert_one(user_doc)
+                "max_connections": package_max_connections
+            })
             
-            return {
+            return user_doc, {
                 "success": True,
                 "message": f"Subscriber '{username}' created successfully on {panel_name}",
                 "user": {
@@ -7162,7 +7278,7 @@ async def create_imported_user(data: CreateImportedUserRequest, current_user: di
                 raise HTTPException(status_code=400, detail="package_id is required for subscriber creation")
 
             # Get package details
-            pkg_result = os_service.get_packages()
+            pkg_result = await run_panel_call(os_service.get_packages)
             package_duration_hours = 720  # default 30 days
             package_max_connections = 1
             if pkg_result.get("success"):
@@ -7172,7 +7288,8 @@ async def create_imported_user(data: CreateImportedUserRequest, current_user: di
                         package_max_connections = pkg.get("max_connections", 1)
                         break
 
-            result = os_service.create_line(
+            result = await run_panel_call(
+                os_service.create_line,
                 username=username, password=password,
                 package_id=data.package_id,
                 reseller_notes=f"Manual - {current_user.get('email', 'Admin')}",
@@ -7181,23 +7298,21 @@ async def create_imported_user(data: CreateImportedUserRequest, current_user: di
             if not result.get("success"):
                 raise HTTPException(status_code=500, detail=result.get("error", "Failed to create line on 1-Stream"))
 
-            expiry_date = datetime.utcnow() + timedelta(hours=package_duration_hours)
+            now = datetime.utcnow()
+            expiry_date = now + timedelta(hours=package_duration_hours)
             if result.get("expire_at"):
                 try:
                     expiry_date = datetime.fromisoformat(result["expire_at"].replace("Z", "+00:00"))
                 except Exception:
                     pass
 
-            user_doc = {
-                "panel_index": panel_index, "panel_type": "onestream", "panel_name": panel_name,
+            user_doc = _base_user_doc(panel_index, "onestream", panel_name, username, password, "subscriber", now)
+            user_doc.update({
                 "onestream_line_id": result.get("line_id", ""),
-                "username": username, "password": password,
-                "expiry_date": expiry_date, "status": "active",
-                "max_connections": package_max_connections, "account_type": "subscriber",
-                "last_synced": datetime.utcnow(), "created_at": datetime.utcnow()
-            }
-            await imported_users_collection.insert_one(user_doc)
-            return {
+                "expiry_date": expiry_date,
+                "max_connections": package_max_connections
+            })
+            return user_doc, {
                 "success": True,
                 "message": f"Subscriber '{username}' created on {panel_name}",
                 "user": {"username": username, "password": password, "panel_name": panel_name,
@@ -7206,7 +7321,8 @@ async def create_imported_user(data: CreateImportedUserRequest, current_user: di
             }
 
         else:  # reseller
-            result = os_service.create_subreseller(
+            result = await run_panel_call(
+                os_service.create_subreseller,
                 name=username, email=f"{username}@billing.local",
                 password=password, credits=data.credits or 0,
                 notes=f"Manual - {current_user.get('email', 'Admin')}"
@@ -7214,15 +7330,13 @@ async def create_imported_user(data: CreateImportedUserRequest, current_user: di
             if not result.get("success"):
                 raise HTTPException(status_code=500, detail=result.get("error", "Failed to create reseller on 1-Stream"))
 
-            user_doc = {
-                "panel_index": panel_index, "panel_type": "onestream", "panel_name": panel_name,
+            user_doc = _base_user_doc(panel_index, "onestream", panel_name, username, password, "reseller", datetime.utcnow())
+            user_doc.update({
                 "onestream_user_id": result.get("user_id", 0),
-                "username": username, "password": password,
-                "expiry_date": None, "status": "active", "credits": data.credits,
-                "account_type": "reseller", "last_synced": datetime.utcnow(), "created_at": datetime.utcnow()
-            }
-            await imported_users_collection.insert_one(user_doc)
-            return {
+                "expiry_date": None,
+                "credits": data.credits
+            })
+            return user_doc, {
                 "success": True,
                 "message": f"Reseller '{username}' created on {panel_name}",
                 "user": {"username": username, "password": password, "panel_name": panel_name,
@@ -7232,6 +7346,64 @@ async def create_imported_user(data: CreateImportedUserRequest, current_user: di
     else:
         raise HTTPException(status_code=400, detail="Invalid panel_type. Must be 'xtream', 'xuione', or 'onestream'")
 
+
+@app.post("/api/admin/imported-users/create")
+async def create_imported_user(data: CreateImportedUserRequest, current_user: dict = Depends(get_current_admin_user)):
+    """Create a new user directly on the panel and add to imported_users collection"""
+    settings = await get_settings()
+    
+    user_doc, response = await _create_panel_user(data, settings, current_user)
+    
+    # Insert into imported_users collection
+    await imported_users_collection.insert_one(user_doc)
+    
+    return response
+
+
+@app.post("/api/admin/subscribers/bulk")
+async def bulk_create_imported_users(items: List[CreateImportedUserRequest], current_user: dict = Depends(get_current_admin_user)):
+    """Create many users on their panels concurrently and add them to imported_users in one insert"""
+    if not items:
+        raise HTTPException(status_code=400, detail="No users to create")
+    
+    settings = await get_settings()
+    
+    # Bound concurrent panel requests so a large batch doesn't overwhelm the panel
+    semaphore = asyncio.Semaphore(10)
+    
+    async def create_one(item: CreateImportedUserRequest):
+        async with semaphore:
+            try:
+                return await _create_panel_user(item, settings, current_user)
+            except HTTPException as e:
+                return None, {"success": False, "username": item.username, "error": e.detail}
+            except Exception as e:
+                logger.error(f"Bulk user creation failed for {item.username or 'generated user'}: {e}")
+                return None, {"success": False, "username": item.username, "error": str(e)}
+    
+    outcomes = await asyncio.gather(*[create_one(item) for item in items])
+    
+    # Insert all panel-created users with a single round-trip
+    user_docs = [user_doc for user_doc, _ in outcomes if user_doc]
+    if user_docs:
+        await imported_users_collection.insert_many(user_docs, ordered=False)
+    
+    results = [response for _, response in outcomes]
+    created = len(user_docs)
+    
+    return {
+        "success": created > 0,
+        "message": f"Created {created} of {len(items)} users",
+        "created": created,
+        "failed": len(items) - created,
+        "results": results
+    }
+
+
+# Bouquet name fragments that mark VOD / Series bouquets
+_VOD_SERIES_RE = re.compile(r'movie|series|vod|24/7', re.IGNORECASE)
+
+
 @app.get("/api/products/{product_id}/channels")
 async def get_product_channels(product_id: str):
     """Get LIVE channel list for a product (public endpoint) - excludes VOD and Series"""
@@ -7255,20 +7427,17 @@ async def get_product_channels(product_id: str):
     if not panel_bouquets:
         panel_bouquets = settings.get("bouquets", [])
     
+    # Index bouquets by int ID once instead of scanning the list per product bouquet
+    bouquet_by_id = {int(b.get("id")): b for b in panel_bouquets if b.get("id") is not None}
+    
     # Get LIVE channel bouquets only (exclude VOD and Series)
     live_channels = []
     for bouquet_id in bouquet_ids:
-        # Match by converting both to int for comparison
-        bouquet = next((b for b in panel_bouquets if int(b.get("id")) == int(bouquet_id)), None)
+        bouquet = bouquet_by_id.get(int(bouquet_id))
         if bouquet:
             bouquet_name = bouquet.get("name", "")
-            # Filter out VOD and Series - check both type field and name
-            is_vod_or_series = (
-                'movie' in bouquet_name.lower() or
-                'series' in bouquet_name.lower() or
-                'vod' in bouquet_name.lower() or
-                '24/7' in bouquet_name.lower()
-            )
+            # Filter out VOD and Series by name
+            is_vod_or_series = _VOD_SERIES_RE.search(bouquet_name) is not None
             
             if not is_vod_or_series:
                 live_channels.append({
@@ -7295,7 +7464,8 @@ async def get_bouquet_channels(bouquet_id: int, panel_index: int = 0):
     panel_bouquets_key = f"bouquets_panel_{panel_index}"
     panel_bouquets = settings.get(panel_bouquets_key, [])
     
-    bouquet = next((b for b in panel_bouquets if int(b.get("id")) == int(bouquet_id)), None)
+    bouquet_by_id = {int(b.get("id")): b for b in panel_bouquets if b.get("id") is not None}
+    bouquet = bouquet_by_id.get(int(bouquet_id))
     bouquet_name = bouquet.get("name", f"Package {bouquet_id}") if bouquet else f"Package {bouquet_id}"
     
     return {
@@ -7328,17 +7498,12 @@ async def get_packages(current_user: dict = Depends(get_current_admin_user)):
 @app.put("/api/admin/bouquets")
 async def update_bouquets(bouquets: List[dict], current_user: dict = Depends(get_current_admin_user)):
     """Update bouquet configuration"""
-    existing = await settings_collection.find_one()
-    if existing:
-        await settings_collection.update_one(
-            {"_id": existing["_id"]},
-            {"$set": {"bouquets": bouquets, "updated_at": datetime.utcnow()}}
-        )
-    else:
-        await settings_collection.insert_one({
-            "bouquets": bouquets,
-            "updated_at": datetime.utcnow()
-        })
+    await settings_collection.update_one(
+        {},
+        {"$set": {"bouquets": bouquets, "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    invalidate_settings_cache()
     
     return {"message": "Bouquets updated successfully"}
 
@@ -7366,23 +7531,20 @@ async def get_my_referral_code(current_user: dict = Depends(get_current_user)):
     user_id = current_user["sub"]
     code = await referral_service.create_referral_code_for_user(user_id)
     
-    # Get referral stats
-    referrals = await referral_service.get_user_referrals(user_id)
-    completed = len([r for r in referrals if r["status"] == "completed"])
-    total_earned = sum(r.get("reward_amount", 0) for r in referrals if r.get("rewarded"))
-    
-    # Get settings for display
-    settings = await get_settings()
+    # Get referral stats and settings for display
+    summary, settings = await asyncio.gather(
+        referral_service.get_user_referral_summary(user_id),
+        get_settings()
+    )
     referral_settings = settings.get("referral", {})
     credit_settings = settings.get("credit", {})
     
     return {
         "referral_code": code,
         "referral_link": f"{os.getenv('BACKEND_PUBLIC_URL', '')}/register?ref={code}",
-        "total_referrals": len(referrals),
-        "completed_referrals": completed,
-        "total_earned": total_earned,
-        "referrals": referrals,
+        "total_referrals": summary["total_referrals"],
+        "completed_referrals": summary["completed_referrals"],
+        "total_earned": summary["total_earned"],
         "settings": {
             "referrer_reward": referral_settings.get("referrer_reward", 10.0),
             "referred_reward": referral_settings.get("referred_reward", 5.0),
@@ -7413,16 +7575,14 @@ class CouponCreate(BaseModel):
     max_uses: Optional[int] = None
     valid_until: Optional[datetime] = None
     applies_to: str = "all"
-    product_ids: List[str] = []
+    product_ids: List[str] = Field(default_factory=list)
+    
+    class Config:
+        frozen = True
 
 @app.post("/api/admin/coupons")
 async def create_coupon(coupon_data: CouponCreate, current_user: dict = Depends(get_current_admin_user)):
     """Create a new coupon"""
-    # Check if code already exists
-    existing = await coupons_collection.find_one({"code": coupon_data.code.upper()})
-    if existing:
-        raise HTTPException(status_code=400, detail="Coupon code already exists")
-    
     coupon = {
         "code": coupon_data.code.upper(),
         "coupon_type": coupon_data.coupon_type,
@@ -7439,24 +7599,22 @@ async def create_coupon(coupon_data: CouponCreate, current_user: dict = Depends(
         "created_at": datetime.utcnow()
     }
     
-    result = await coupons_collection.insert_one(coupon)
+    # Code uniqueness is enforced by the unique index on coupons.code; check by hand if it could not be built
+    if not _coupon_code_index_ready:
+        existing = await coupons_collection.find_one({"code": coupon["code"]}, {"_id": 1})
+        if existing:
+            raise HTTPException(status_code=400, detail="Coupon code already exists")
+    
+    try:
+        result = await coupons_collection.insert_one(coupon)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Coupon code already exists")
     return {"message": "Coupon created", "id": str(result.inserted_id), "code": coupon["code"]}
 
 @app.get("/api/admin/coupons")
 async def get_all_coupons(current_user: dict = Depends(get_current_admin_user)):
     """Get all coupons"""
-    coupons = []
-    async for coupon in coupons_collection.find().sort("created_at", -1):
-        coupon["id"] = str(coupon["_id"])
-        del coupon["_id"]
-        
-        # Get stats
-        stats = await coupon_service.get_coupon_stats(coupon["id"])
-        coupon.update(stats)
-        
-        coupons.append(coupon)
-    
-    return coupons
+    return await coupon_service.get_all_coupons_with_stats()
 
 @app.post("/api/coupon/validate")
 async def validate_coupon_code(code: str, order_total: float, product_ids: List[str] = []):
@@ -7534,7 +7692,10 @@ class DownloadCreate(BaseModel):
     version: str = ""
     platform: str = "all"
     requires_active_service: bool = True
-    linked_service_types: List[str] = []
+    linked_service_types: List[str] = Field(default_factory=list)
+    
+    class Config:
+        frozen = True
 
 @app.post("/api/admin/downloads")
 async def create_download(download_data: DownloadCreate, current_user: dict = Depends(get_current_admin_user)):
@@ -7592,24 +7753,35 @@ async def delete_download(download_id: str, current_user: dict = Depends(get_cur
     await downloads_collection.delete_one({"_id": str_to_objectid(download_id)})
     return {"message": "Download deleted"}
 
+# Fields of a download document needed by the customer downloads page
+_USER_DOWNLOAD_PROJECTION = {
+    "name": 1, "description": 1, "category": 1, "file_url": 1, "file_size": 1,
+    "file_type": 1, "version": 1, "platform": 1, "download_count": 1,
+    "requires_active_service": 1, "linked_service_types": 1
+}
+
 @app.get("/api/downloads")
 async def get_available_downloads(current_user: dict = Depends(get_current_user)):
     """Get downloads available to user based on products they own"""
     user_id = current_user["sub"]
     
-    # Get user's active services and their product IDs
-    active_services = []
-    user_product_ids = []
-    async for service in services_collection.find({"user_id": user_id, "status": "active"}):
-        active_services.append(service)
-        if service.get("product_id"):
-            user_product_ids.append(service["product_id"])
+    # Fetch user's active services and available downloads concurrently
+    services, active_downloads = await asyncio.gather(
+        services_collection.find(
+            {"user_id": user_id, "status": "active"},
+            {"product_id": 1}
+        ).to_list(length=None),
+        downloads_collection.find(
+            {"active": True},
+            _USER_DOWNLOAD_PROJECTION
+        ).sort("category", 1).to_list(length=None)
+    )
     
-    has_active_service = len(active_services) > 0
+    user_product_ids = {s["product_id"] for s in services if s.get("product_id")}
+    has_active_service = bool(services)
     
-    # Get available downloads
     downloads = []
-    async for download in downloads_collection.find({"active": True}).sort("category", 1):
+    for download in active_downloads:
         # Check if user can access this download
         can_access = True
         
@@ -7619,13 +7791,9 @@ async def get_available_downloads(current_user: dict = Depends(get_current_user)
         
         # Check linked products
         linked_products = download.get("linked_service_types", [])  # Will rename to linked_product_ids
-        if linked_products and len(linked_products) > 0:
+        if linked_products:
             # Check if user has any of the required products
-            user_has_matching = any(
-                product_id in linked_products 
-                for product_id in user_product_ids
-            )
-            if not user_has_matching:
+            if user_product_ids.isdisjoint(linked_products):
                 can_access = False
         
         if can_access:
@@ -7645,22 +7813,26 @@ async def track_download(
     current_user: dict = Depends(get_current_user)
 ):
     """Track download and increment counter"""
-    # Log download
-    await download_logs_collection.insert_one({
-        "download_id": download_id,
-        "user_id": current_user["sub"],
-        "ip_address": request.client.host,
-        "downloaded_at": datetime.utcnow()
-    })
-    
-    # Increment counter
-    await downloads_collection.update_one(
-        {"_id": str_to_objectid(download_id)},
-        {"$inc": {"download_count": 1}}
+    download_oid = str_to_objectid(download_id)
+    
+    # Log download and increment counter concurrently
+    _, download = await asyncio.gather(
+        download_logs_collection.insert_one({
+            "download_id": download_id,
+            "user_id": current_user["sub"],
+            "ip_address": request.client.host,
+            "downloaded_at": datetime.utcnow()
+        }),
+        downloads_collection.find_one_and_update(
+            {"_id": download_oid},
+            {"$inc": {"download_count": 1}},
+            projection={"file_url": 1, "name": 1},
+            return_document=ReturnDocument.AFTER
+        )
     )
     
-    # Get download info
-    download = await downloads_collection.find_one({"_id": str_to_objectid(download_id)})
+    if not download:
+        raise HTTPException(status_code=404, detail="Download not found")
     
     return {"file_url": download.get("file_url"), "file_name": download.get("name")}
 
@@ -7701,6 +7873,10 @@ async def get_license_status():
     }
 
 
+# License key format: XXXX-XXXX-XXXX-XXXX
+_LICENSE_KEY_RE = re.compile(r'[A-Z0-9]{4}-[A-Z0-9]{4}-[A-Z0-9]{4}-[A-Z0-9]{4}')
+
+
 @app.post("/api/admin/activate-license")
 async def save_license_key_endpoint(request: dict):
     """Activate license by saving to settings (public endpoint for initial activation)"""
@@ -7710,7 +7886,7 @@ async def save_license_key_endpoint(request: dict):
         raise HTTPException(status_code=400, detail="License key is required")
     
     # Validate the license key format
-    if not re.match(r'^[A-Z0-9]{4}-[A-Z0-9]{4}-[A-Z0-9]{4}-[A-Z0-9]{4}$', license_key):
+    if not _LICENSE_KEY_RE.fullmatch(license_key):
         return {
             "valid": False,
             "reason": "Invalid license key format. Expected: XXXX-XXXX-XXXX-XXXX"
@@ -7727,14 +7903,13 @@ async def save_license_key_endpoint(request: dict):
         }
     
     # Save to settings
-    existing = await settings_collection.find_one()
-    if existing:
-        await settings_collection.update_one(
-            {"_id": existing["_id"]},
-            {"$set": {"license_key": license_key}}
-        )
-    else:
-        await settings_collection.insert_one({"license_key": license_key})
+    await settings_collection.update_one(
+        {},
+        {"$set": {"license_key": license_key}, "$currentDate": {"license_updated_at": True}},
+        upsert=True
+    )
+    invalidate_settings_cache()
+    license_manager.clear_validation_cache()
     
     logger.info(f"License activated successfully for domain: {current_domain}")
     
@@ -7757,24 +7932,24 @@ async def upload_download_file(
     # Validate file size (max 100MB for client apps)
     MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
     
-    contents = await file.read()
-    file_size = len(contents)
-    
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="File too large. Maximum size is 100MB")
-    
-    # Create downloads directory dynamically
-    DOWNLOADS_DIR = os.path.join(BASE_DIR, "uploads", "downloads")
-    os.makedirs(DOWNLOADS_DIR, exist_ok=True)
-    
     # Generate unique filename
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
+    unique_filename = _unique_upload_filename(file.filename)
     file_path = os.path.join(DOWNLOADS_DIR, unique_filename)
     
-    # Save file
-    async with aiofiles.open(file_path, 'wb') as f:
-        await f.write(contents)
+    # Stream to disk in 1 MiB chunks, enforcing the size limit as we go
+    file_size = 0
+    fd = await asyncio.to_thread(os.open, file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            file_size += len(chunk)
+            if file_size > MAX_FILE_SIZE:
+                raise HTTPException(status_code=400, detail="File too large. Maximum size is 100MB")
+            await asyncio.to_thread(_write_all, fd, chunk)
+    except BaseException:
+        os.close(fd)
+        os.unlink(file_path)
+        raise
+    os.close(fd)
     
     return {
         "filename": file.filename,
@@ -7825,86 +8000,123 @@ async def approve_refund_endpoint(
 ):
     """Approve a refund request and cancel associated service"""
     # Get refund details
-    refund = await refunds_collection.find_one({"_id": str_to_objectid(refund_id)})
+    # Refund and its order's services in one round trip, alongside settings
+    refunds, settings = await asyncio.gather(
+        refunds_collection.aggregate([
+            {"$match": {"_id": str_to_objectid(refund_id)}},
+            {"$limit": 1},
+            {"$lookup": {
+                "from": "services",
+                "localField": "order_id",
+                "foreignField": "order_id",
+                "as": "services"
+            }}
+        ]).to_list(1),
+        get_settings()
+    )
     
-    if not refund:
+    if not refunds:
         raise HTTPException(status_code=404, detail="Refund not found")
+    refund = refunds[0]
     
     # Approve the refund
     await refund_service.approve_refund(refund_id, current_user["sub"], notes)
     
-    # Find and cancel all services associated with this order
+    # Cancel all services associated with this order
     order_id = refund.get("order_id")
     if order_id:
-        settings = await get_settings()
-        services = await services_collection.find({"order_id": order_id}).to_list(None)
-        
-        for service in services:
-            # Mark service as refunded and suspend on panel
-            if service.get("status") in ["active", "suspended"]:
-                # Suspend on the actual panel (XtreamUI or XuiOne)
-                panel_type = service.get("panel_type", "xtream")
-                panel_index = service.get("panel_index", 0)
-                
-                if panel_type == "xtream":
-                    # Suspend on XtreamUI panel
-                    xtream_panels = settings.get("xtream", {}).get("panels", [])
-                    if panel_index < len(xtream_panels):
+        services = [s for s in refund["services"] if s.get("status") in ["active", "suspended"]]
+        
+        # One client per panel: XtreamUI calls share a session (serialized, since
+        # suspend_account re-logs in), XuiOne logs in once and suspends concurrently
+        xtream_clients: Dict[int, Tuple[XtreamUIService, asyncio.Lock]] = {}
+        xuione_logins: Dict[int, Tuple[XuiOneService, asyncio.Task]] = {}
+        
+        async def suspend_on_panel(service: dict):
+            """Suspend a service on the actual panel (XtreamUI or XuiOne)"""
+            panel_type = service.get("panel_type", "xtream")
+            panel_index = service.get("panel_index", 0)
+            
+            if panel_type == "xtream":
+                # Suspend on XtreamUI panel
+                xtream_panels = settings.get("xtream", {}).get("panels", [])
+                if panel_index < len(xtream_panels):
+                    if panel_index not in xtream_clients:
                         panel = xtream_panels[panel_index]
-                        xtream_service = XtreamUIService(
-                            panel_url=panel["panel_url"],
-                            admin_username=panel["admin_username"],
-                            admin_password=panel["admin_password"]
+                        xtream_clients[panel_index] = (
+                            XtreamUIService(
+                                panel_url=panel["panel_url"],
+                                admin_username=panel["admin_username"],
+                                admin_password=panel["admin_password"]
+                            ),
+                            asyncio.Lock()
                         )
-                        result = xtream_service.suspend_account(
+                    xtream_service, panel_lock = xtream_clients[panel_index]
+                    async with panel_lock:
+                        result = await run_panel_call(
+                            xtream_service.suspend_account,
                             username=service["xtream_username"],
                             password=service["xtream_password"],
                             user_id=service.get("dedicatedip")  # Pass the stored XtreamUI user ID
                         )
-                        if result.get("success"):
-                            logger.info(f"Suspended XtreamUI line {service['xtream_username']}")
-                        else:
-                            logger.warning(f"Failed to suspend XtreamUI line: {result.get('error')}")
-                
-                elif panel_type == "xuione":
-                    # Suspend on XuiOne panel using edit_line with enabled=0
-                    xuione_panels = settings.get("xuione", {}).get("panels", [])
-                    if panel_index < len(xuione_panels):
+                    if result.get("success"):
+                        logger.info(f"Suspended XtreamUI line {service['xtream_username']}")
+                    else:
+                        logger.warning(f"Failed to suspend XtreamUI line: {result.get('error')}")
+            
+            elif panel_type == "xuione":
+                # Suspend on XuiOne panel using edit_line with enabled=0
+                xuione_panels = settings.get("xuione", {}).get("panels", [])
+                if panel_index < len(xuione_panels):
+                    if panel_index not in xuione_logins:
                         panel = xuione_panels[panel_index]
-                        xuione_service = XuiOneService(
+                        new_service = XuiOneService(
                             panel_url=panel["panel_url"],
                             api_access_code=panel.get("api_access_code", ""),
                             api_key=panel.get("api_key", ""),
                             admin_username=panel["admin_username"],
                             admin_password=panel["admin_password"]
                         )
-                        
-                        # Login and suspend line
-                        if xuione_service.login():
-                            line_id = service.get("dedicatedip") or service.get("xuione_line_id")
-                            if line_id:
-                                api_url = xuione_service.get_api_url()
-                                response = xuione_service.session.post(
-                                    api_url,
-                                    params={'api_key': xuione_service.api_key, 'action': 'edit_line'},
-                                    data={'id': line_id, 'enabled': '0'},  # Disable the line
-                                    timeout=30
-                                )
-                                if response.status_code == 200:
-                                    logger.info(f"Suspended XuiOne line {service['xtream_username']}")
-                                else:
-                                    logger.warning(f"Failed to suspend XuiOne line")
-                
-                # Mark service as refunded in database
-                await services_collection.update_one(
+                        xuione_logins[panel_index] = (
+                            new_service,
+                            asyncio.ensure_future(run_panel_call(new_service.login))
+                        )
+                    xuione_service, login_task = xuione_logins[panel_index]
+                    
+                    # Login (once per panel) and suspend line
+                    if await login_task:
+                        line_id = service.get("dedicatedip") or service.get("xuione_line_id")
+                        if line_id:
+                            result = await xuione_service.suspend_line_async(line_id, panel_http_client)
+                            if result.get("success"):
+                                logger.info(f"Suspended XuiOne line {service['xtream_username']}")
+                            else:
+                                logger.warning(f"Failed to suspend XuiOne line: {result.get('error')}")
+        
+        # Suspend all lines concurrently; one failed panel call must not block the rest
+        results = await asyncio.gather(
+            *[suspend_on_panel(service) for service in services],
+            return_exceptions=True
+        )
+        for service, result in zip(services, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to suspend line {service.get('xtream_username')}: {result}")
+        
+        # Mark services as refunded in database with a single bulk write
+        if services:
+            refunded_at = datetime.utcnow()
+            await services_collection.bulk_write([
+                UpdateOne(
                     {"_id": service["_id"]},
                     {"$set": {
                         "status": "refunded",
-                        "refunded_at": datetime.utcnow(),
+                        "refunded_at": refunded_at,
                         "refund_reason": notes or "Customer request"
                     }}
                 )
-                logger.info(f"Marked service {service.get('xtream_username')} as refunded")
+                for service in services
+            ], ordered=False)
+            logger.info(f"Marked {len(services)} service(s) as refunded for order {order_id}")
     
     return {"message": "Refund approved, service(s) suspended on panel"}
 
@@ -7952,4 +8164,5 @@ async def download_user_guide(current_user=Depends(get_current_admin_user)):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    # Single worker: the background scheduler runs in-process
+    uvicorn.run(app, host="0.0.0.0", port=8001, loop="uvloop", http="httptools", access_log=False)
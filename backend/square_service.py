@@ -1,7 +1,9 @@
 from square.client import Square, SquareEnvironment
+import asyncio
 import os
 import logging
 import uuid
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +32,9 @@ class SquareService:
             # Square requires idempotency_key <= 45 chars
             idempotency_key = f"{order_id[:12]}_{uuid.uuid4().hex[:20]}"  # Max 33 chars
             
-            result = self.client.payments.create(
+            # The SDK call is blocking; keep the event loop free during the Square round trip
+            result = await asyncio.to_thread(
+                self.client.payments.create,
                 idempotency_key=idempotency_key,
                 source_id=source_id,
                 amount_money={
@@ -61,14 +65,24 @@ class SquareService:
             logger.error(f"Square payment error: {e}")
             return {"success": False, "error": str(e)}
 
+@lru_cache(maxsize=8)
+def _get_cached_square_service(access_token, application_id, location_id, environment):
+    """One SquareService (and its SDK client) per credential set"""
+    return SquareService(
+        access_token=access_token,
+        application_id=application_id,
+        location_id=location_id,
+        environment=environment
+    )
+
 def get_square_service(square_settings=None):
     """Get Square service instance"""
     if not square_settings or not square_settings.get("enabled"):
         return None
     
-    return SquareService(
-        access_token=square_settings.get("access_token"),
-        application_id=square_settings.get("application_id"),
-        location_id=square_settings.get("location_id"),
-        environment=square_settings.get("environment", "sandbox")
+    return _get_cached_square_service(
+        square_settings.get("access_token"),
+        square_settings.get("application_id"),
+        square_settings.get("location_id"),
+        square_settings.get("environment", "sandbox")
     )
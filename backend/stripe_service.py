@@ -1,6 +1,7 @@
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
 import logging
 import os
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
@@ -94,6 +95,11 @@ class StripeService:
             logger.error(f"Stripe webhook error: {e}")
             return {"success": False, "error": str(e)}
 
+@lru_cache(maxsize=16)
+def _get_cached_stripe_service(api_key, webhook_url):
+    """One StripeService (and its StripeCheckout client) per key/webhook pair"""
+    return StripeService(api_key=api_key, webhook_url=webhook_url)
+
 def get_stripe_service(stripe_settings=None, webhook_url=""):
     """Get Stripe service instance"""
     if not stripe_settings or not stripe_settings.get("enabled"):
@@ -111,7 +117,4 @@ def get_stripe_service(stripe_settings=None, webhook_url=""):
         api_key = "sk_test_emergent"
         logger.info("Using test Stripe key")
     
-    return StripeService(
-        api_key=api_key,
-        webhook_url=webhook_url
-    )
+    return _get_cached_stripe_service(api_key, webhook_url)
@@ -1,13 +1,36 @@
 """Two-Factor Authentication Service using TOTP (Google Authenticator)"""
 import pyotp
-import qrcode
+import segno
 import io
 import base64
+from functools import lru_cache
 from typing import Tuple, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+@lru_cache(maxsize=4096)
+def _get_totp(secret: str) -> pyotp.TOTP:
+    """Return a reusable TOTP object for a secret (TOTP objects hold no per-call state)"""
+    return pyotp.TOTP(secret)
+
+
+@lru_cache(maxsize=256)
+def _qr_code_data_uri(secret: str, email: str, issuer: str) -> str:
+    """Render the provisioning QR code for a secret as an SVG data URI"""
+    uri = _get_totp(secret).provisioning_uri(name=email, issuer_name=issuer)
+    
+    qr = segno.make(uri, error='L', boost_error=False)
+    
+    # SVG stays small and scales without re-rendering
+    buffer = io.BytesIO()
+    qr.save(buffer, kind='svg', scale=10, border=4, xmldecl=False)
+    img_base64 = base64.b64encode(buffer.getvalue()).decode()
+    
+    return f"data:image/svg+xml;base64,{img_base64}"
+
+
 class TwoFactorService:
     """Service for managing TOTP-based 2FA"""
     
@@ -20,30 +43,7 @@ class TwoFactorService:
     def generate_qr_code(secret: str, email: str, issuer: str = "IPTV Billing") -> str:
         """Generate QR code as base64 image for Google Authenticator"""
         try:
-            # Create TOTP URI
-            totp = pyotp.TOTP(secret)
-            uri = totp.provisioning_uri(name=email, issuer_name=issuer)
-            
-            # Generate QR code
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(uri)
-            qr.make(fit=True)
-            
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            # Convert to base64
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)
-            img_base64 = base64.b64encode(buffer.getvalue()).decode()
-            
-            return f"data:image/png;base64,{img_base64}"
-            
+            return _qr_code_data_uri(secret, email, issuer)
         except Exception as e:
             logger.error(f"Failed to generate QR code: {e}")
             raise Exception(f"QR code generation failed: {str(e)}")
@@ -52,9 +52,8 @@ class TwoFactorService:
     def verify_totp(secret: str, code: str) -> bool:
         """Verify a TOTP code against the secret"""
         try:
-            totp = pyotp.TOTP(secret)
             # Allow 1 time window before and after for clock drift
-            return totp.verify(code, valid_window=1)
+            return _get_totp(secret).verify(code, valid_window=1)
         except Exception as e:
             logger.error(f"TOTP verification error: {e}")
             return False
@@ -63,13 +62,9 @@ class TwoFactorService:
     def get_backup_codes(count: int = 10) -> list:
         """Generate backup codes for 2FA recovery"""
         import secrets
-        import string
         
-        codes = []
-        for _ in range(count):
-            code = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(8))
-            # Format as XXXX-XXXX
-            formatted = f"{code[:4]}-{code[4:]}"
-            codes.append(formatted)
+        # One CSPRNG read; base32 maps every 5 random bytes to exactly 8 characters (A-Z, 2-7)
+        encoded = base64.b32encode(secrets.token_bytes(count * 5)).decode()
         
-        return codes
+        # Format as XXXX-XXXX
+        return [f"{encoded[i:i + 4]}-{encoded[i + 4:i + 8]}" for i in range(0, count * 8, 8)]
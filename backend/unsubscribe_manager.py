@@ -1,14 +1,77 @@
 from datetime import datetime
+import asyncio
 import logging
+import time
+from pymongo import UpdateOne
 
 logger = logging.getLogger(__name__)
 
+# Per-email unsubscribe status is cached briefly since every outbound email checks it
+UNSUBSCRIBE_CACHE_TTL = 60
+UNSUBSCRIBE_CACHE_MAX_SIZE = 10000
+# Stands in for records written before unsubscribed_from existed: they block everything but transactional
+LEGACY_UNSUBSCRIBE = "legacy"
+
 class UnsubscribeManager:
     """Manage email unsubscribe preferences"""
     
     def __init__(self, db):
         self.db = db
         self.unsubscribes = db.email_unsubscribes
+        # email -> (expires_at, unsubscribed_from or None)
+        self._status_cache = {}
+        # Emails unsubscribed from "all"; None until loaded, then kept in sync on every write
+        self._unsubscribed_all = None
+    
+    async def ensure_indexes(self):
+        """Create indexes used by unsubscribe lookups and the admin listing"""
+        await self.unsubscribes.create_index("email", unique=True)
+        await self.unsubscribes.create_index([("unsubscribed_at", -1)])
+    
+    async def load_unsubscribed_all(self):
+        """Load the set of emails unsubscribed from everything (transactional fast path)"""
+        emails = set()
+        async for doc in self.unsubscribes.find({"unsubscribed_from": "all"}, {"email": 1, "_id": 0}):
+            emails.add(doc.get("email"))
+        self._unsubscribed_all = emails
+        logger.info(f"Loaded {len(emails)} fully unsubscribed email(s)")
+    
+    def _track_unsubscribed_all(self, email: str, unsubscribed_from):
+        """Keep the loaded "all" set in step with a write"""
+        if self._unsubscribed_all is None:
+            return
+        if unsubscribed_from == "all":
+            self._unsubscribed_all.add(email)
+        else:
+            self._unsubscribed_all.discard(email)
+    
+    async def _get_unsubscribed_from(self, email: str):
+        """Return what the email is unsubscribed from ("all", a type, LEGACY_UNSUBSCRIBE, or None if subscribed)"""
+        cached = self._status_cache.get(email)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        
+        unsubscribe = await self.unsubscribes.find_one({"email": email}, {"unsubscribed_from": 1, "_id": 0})
+        unsubscribed_from = unsubscribe.get("unsubscribed_from", LEGACY_UNSUBSCRIBE) if unsubscribe else None
+        
+        if len(self._status_cache) >= UNSUBSCRIBE_CACHE_MAX_SIZE:
+            self._status_cache.clear()
+        self._status_cache[email] = (time.monotonic() + UNSUBSCRIBE_CACHE_TTL, unsubscribed_from)
+        return unsubscribed_from
+    
+    @staticmethod
+    def _unsubscribe_update(unsubscribe_type, reason, reason_text, customer_id, ip_address) -> dict:
+        """Build the upsert update for an unsubscribe; customer_id is only set on first unsubscribe"""
+        return {
+            "$set": {
+                "unsubscribed_from": unsubscribe_type,
+                "reason": reason,
+                "reason_text": reason_text,
+                "unsubscribed_at": datetime.utcnow(),
+                "ip_address": ip_address
+            },
+            "$setOnInsert": {"customer_id": customer_id}
+        }
     
     async def unsubscribe(
         self,
@@ -20,51 +83,60 @@ class UnsubscribeManager:
         ip_address: str = None
     ):
         """Unsubscribe an email address"""
-        existing = await self.unsubscribes.find_one({"email": email})
+        await self.unsubscribes.update_one(
+            {"email": email},
+            self._unsubscribe_update(unsubscribe_type, reason, reason_text, customer_id, ip_address),
+            upsert=True
+        )
         
-        if existing:
-            # Update existing unsubscribe
-            await self.unsubscribes.update_one(
-                {"email": email},
-                {"$set": {
-                    "unsubscribed_from": unsubscribe_type,
-                    "reason": reason,
-                    "reason_text": reason_text,
-                    "unsubscribed_at": datetime.utcnow(),
-                    "ip_address": ip_address
-                }}
+        self._status_cache.pop(email, None)
+        self._track_unsubscribed_all(email, unsubscribe_type)
+        logger.info(f"Email unsubscribed: {email} from {unsubscribe_type}")
+    
+    async def bulk_unsubscribe(self, entries: list) -> int:
+        """Unsubscribe many emails in one round-trip (entries take unsubscribe()'s keyword arguments)"""
+        operations = [
+            UpdateOne(
+                {"email": entry["email"]},
+                self._unsubscribe_update(
+                    entry.get("unsubscribe_type", "all"),
+                    entry.get("reason"),
+                    entry.get("reason_text"),
+                    entry.get("customer_id"),
+                    entry.get("ip_address")
+                ),
+                upsert=True
             )
-        else:
-            # Create new unsubscribe
-            unsubscribe_data = {
-                "email": email,
-                "customer_id": customer_id,
-                "unsubscribed_from": unsubscribe_type,
-                "reason": reason,
-                "reason_text": reason_text,
-                "unsubscribed_at": datetime.utcnow(),
-                "ip_address": ip_address
-            }
-            await self.unsubscribes.insert_one(unsubscribe_data)
+            for entry in entries if entry.get("email")
+        ]
+        if not operations:
+            return 0
         
-        logger.info(f"Email unsubscribed: {email} from {unsubscribe_type}")
+        result = await self.unsubscribes.bulk_write(operations, ordered=False)
+        for entry in entries:
+            self._status_cache.pop(entry.get("email"), None)
+            if entry.get("email"):
+                self._track_unsubscribed_all(entry["email"], entry.get("unsubscribe_type", "all"))
+        
+        logger.info(f"Bulk unsubscribed {len(operations)} email(s)")
+        return result.upserted_count + result.modified_count
     
     async def resubscribe(self, email: str):
         """Remove unsubscribe (customer wants to receive emails again)"""
         await self.unsubscribes.delete_one({"email": email})
+        self._status_cache.pop(email, None)
+        self._track_unsubscribed_all(email, None)
         logger.info(f"Email resubscribed: {email}")
     
     async def is_unsubscribed(self, email: str, email_type: str = "marketing") -> bool:
         """Check if an email is unsubscribed"""
-        unsubscribe = await self.unsubscribes.find_one({"email": email})
+        unsubscribed_from = await self._get_unsubscribed_from(email)
         
-        if not unsubscribe:
+        if unsubscribed_from is None:
             return False
         
-        unsubscribed_from = unsubscribe.get("unsubscribed_from", "all")
-        
         # If unsubscribed from "all", they don't receive anything
-        if unsubscribed_from == "all":
+        if unsubscribed_from in ("all", LEGACY_UNSUBSCRIBE):
             return True
         
         # If unsubscribed from specific type, check it
@@ -79,21 +151,24 @@ class UnsubscribeManager:
     
     async def can_send_transactional(self, email: str) -> bool:
         """Transactional emails can always be sent unless user unsubscribed from ALL"""
-        unsubscribe = await self.unsubscribes.find_one({"email": email})
-        if not unsubscribe:
-            return True
-        return unsubscribe.get("unsubscribed_from") != "all"
+        if self._unsubscribed_all is not None:
+            return email not in self._unsubscribed_all
+        return await self._get_unsubscribed_from(email) != "all"
     
     async def get_all_unsubscribes(self, limit: int = 100, skip: int = 0):
         """Get list of all unsubscribed emails"""
-        unsubscribes = []
-        cursor = self.unsubscribes.find().sort("unsubscribed_at", -1).skip(skip).limit(limit)
-        
-        async for unsub in cursor:
-            unsub["id"] = str(unsub["_id"])
-            del unsub["_id"]
-            unsubscribes.append(unsub)
+        pipeline = [
+            {"$sort": {"unsubscribed_at": -1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$addFields": {"id": {"$toString": "$_id"}}},
+            {"$project": {"_id": 0}}
+        ]
         
-        total = await self.unsubscribes.count_documents({})
+        # The listing is unfiltered, so the collection metadata count is exact enough and avoids a scan
+        unsubscribes, total = await asyncio.gather(
+            self.unsubscribes.aggregate(pipeline).to_list(length=limit),
+            self.unsubscribes.estimated_document_count()
+        )
         
         return {"items": unsubscribes, "total": total}
@@ -2,16 +2,225 @@
 Auto-Update System for IPTV Billing Panel - SAFE VERSION
 Pulls updates from GitHub using overlay method (no file deletion)
 """
+import ctypes
 import os
 import subprocess
 import shutil
+import fcntl
+import filecmp
+import fnmatch
+import hashlib
 import json
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from pathlib import Path
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Seconds to reuse the last `git ls-remote` result (0 disables the cache)
+UPDATE_CHECK_TTL = float(os.environ.get("UPDATE_CHECK_TTL", "120"))
+
+# Never wait on a credential prompt; fail fast instead of hitting the timeout
+GIT_ENV = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+
+# File copies are I/O bound (the GIL is released in read/write), so overlap them
+COPY_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+BACKUP_MANIFEST = "manifest.json"
+
+# Backups are single gzip tarballs; level 1 keeps creation I/O-bound rather than CPU-bound
+BACKUP_SUFFIX = ".tar.gz"
+BACKUP_COMPRESS_LEVEL = 1
+BACKUP_EXCLUDES = {
+    "backend": ('__pycache__', '*.pyc', '.venv'),
+    "frontend": ('node_modules', 'build'),
+}
+
+UPDATE_TEMP_DIR = "/tmp/iptvbcms_update"
+
+# Only these top-level directories are overlaid, so only they are exported
+UPDATE_PATHS = ("backend", "frontend")
+
+# Entries kept in the applied-commits log
+APPLIED_COMMITS_LIMIT = 100
+
+# Runtime data the app writes under backend/; carried across the backend swap
+BACKEND_DATA_PATHS = ('.env', '.backup_settings.json', 'uploads', 'invoices')
+
+# Names the backup a kept backend.old tree was swapped out for, so rollback can swap it back
+ROLLBACK_MARKER = ".update_backup"
+
+
+def _fast_copy(src, dst):
+    """Copy contents in-kernel (copy_file_range, else sendfile), then metadata like copy2"""
+    # Write a new inode: never modify a hard-linked (staged) or open file in place
+    try:
+        os.unlink(dst)
+    except FileNotFoundError:
+        pass
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        infd, outfd = fsrc.fileno(), fdst.fileno()
+        try:
+            while os.copy_file_range(infd, outfd, COPY_CHUNK_SIZE):
+                pass
+        except (AttributeError, OSError):
+            # Not supported here (e.g. EXDEV across filesystems on older kernels);
+            # both offsets advance together, so continue from where it stopped
+            while os.sendfile(outfd, infd, None, COPY_CHUNK_SIZE):
+                pass
+    shutil.copystat(src, dst)
+
+
+_libc = ctypes.CDLL(None, use_errno=True)
+_renameat2 = getattr(_libc, "renameat2", None)
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+
+def _exchange_paths(a, b):
+    """Atomically swap two paths with renameat2(RENAME_EXCHANGE); False if unsupported"""
+    if _renameat2 is None:
+        return False
+    return _renameat2(AT_FDCWD, os.fsencode(a), AT_FDCWD, os.fsencode(b), RENAME_EXCHANGE) == 0
+
+
+def _fast_rmtree(path):
+    """Delete a directory tree; rm -rf walks it in C rather than Python"""
+    if os.name == 'posix':
+        subprocess.run(["rm", "-rf", "--", path], check=True)
+    else:
+        shutil.rmtree(path)
+
+
+def _tree_size(root):
+    """Total size of regular files under root (scandir reuses the dirent type info)"""
+    total = 0
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+def _exclude_filter(patterns, counter=None):
+    """tarfile.add filter dropping entries whose name matches any pattern (counting kept files)"""
+    def _filter(tarinfo):
+        name = os.path.basename(tarinfo.name)
+        if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            return None
+        if counter is not None and tarinfo.isfile():
+            counter["files"] += 1
+        return tarinfo
+    return _filter
+
+
+class _HashingWriter:
+    """File wrapper that hashes everything written through it"""
+    
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hash = hashlib.sha256()
+    
+    def write(self, data):
+        self.hash.update(data)
+        return self.fileobj.write(data)
+
+
+def _file_sha256(path):
+    """sha256 hex digest of a file, read in 1 MiB chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _plan_overlay(src_root, dst_root, skip_dirs=(), skip_files=()):
+    """Walk src_root once; return the target dirs (parents first) and (src, dst) file pairs"""
+    dirs_to_create = []
+    pairs = []
+    for root, dirs, files in os.walk(src_root):
+        dirs[:] = [d for d in dirs if d not in skip_dirs]
+        
+        rel_path = os.path.relpath(root, src_root)
+        target_dir = dst_root if rel_path == '.' else os.path.join(dst_root, rel_path)
+        dirs_to_create.append(target_dir)
+        pairs.extend(
+            (os.path.join(root, file), os.path.join(target_dir, file))
+            for file in files if file not in skip_files
+        )
+    return dirs_to_create, pairs
+
+
+def _overlay_tree(src_root, dst_root, skip_dirs=(), skip_files=()):
+    """Copy src_root over dst_root without deleting anything already there"""
+    dirs_to_create, pairs = _plan_overlay(src_root, dst_root, skip_dirs, skip_files)
+    # os.walk is top-down, so each parent exists before its children
+    for target_dir in dirs_to_create:
+        try:
+            os.mkdir(target_dir)
+        except FileExistsError:
+            pass
+    _copy_files(pairs)
+
+
+def _copy_if_changed(src, dst):
+    """Copy src over dst unless dst already has the same size, mode and bytes"""
+    try:
+        src_stat, dst_stat = os.stat(src), os.stat(dst)
+    except FileNotFoundError:
+        _fast_copy(src, dst)
+        return
+    if (
+        src_stat.st_size == dst_stat.st_size
+        and src_stat.st_mode == dst_stat.st_mode
+        and filecmp.cmp(src, dst, shallow=False)
+    ):
+        return
+    _fast_copy(src, dst)
+
+
+def _carry_over(src_root, dst_root, paths, since):
+    """Copy data files created or replaced under src_root since a hard-link snapshot into dst_root
+
+    Files rewritten in place share an inode with the snapshot and need no copy.
+    """
+    dirs_to_create, pairs = [], []
+    for path in paths:
+        src = os.path.join(src_root, path)
+        if os.path.isdir(src):
+            dirs, dir_pairs = _plan_overlay(src, os.path.join(dst_root, path))
+            dirs_to_create.extend(dirs)
+            pairs.extend(dir_pairs)
+        elif os.path.isfile(src):
+            pairs.append((src, os.path.join(dst_root, path)))
+    for target_dir in dirs_to_create:
+        os.makedirs(target_dir, exist_ok=True)
+    _copy_files([
+        (src, dst) for src, dst in pairs
+        if not os.path.exists(dst)
+        or (os.stat(src).st_mtime >= since and not os.path.samefile(src, dst))
+    ])
+
+
+def _copy_files(pairs):
+    """Copy (src, dst) pairs in parallel, skipping unchanged files; target directories must exist"""
+    if not pairs:
+        return
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+        # list() surfaces the first copy error
+        list(executor.map(lambda pair: _copy_if_changed(*pair), pairs))
+
+
 class UpdateManager:
     def __init__(self):
         self.repo_url = "https://github.com/asherpoirier/iptvbcms.git"
@@ -24,6 +233,16 @@ class UpdateManager:
         
         self.backup_dir = f"{self.app_dir}/backups"
         self.version_file = f"{self.app_dir}/VERSION.json"
+        # Persistent bare repo so each update only fetches what changed
+        self.mirror_dir = f"{self.app_dir}/.update-cache"
+        # "<commit> <unix time>" per applied update; survives the post-update restart
+        self.applied_cache = f"{self.app_dir}/.applied_commits"
+        # Held for the whole backup + update so concurrent requests can't interleave
+        self.lock_path = f"{self.app_dir}/.update.lock"
+        
+        # (commit_hash, monotonic timestamp) of the last successful remote check
+        self._latest_cache = None
+        self._latest_lock = threading.Lock()
         
         logger.info(f"UpdateManager initialized with app_dir: {self.app_dir}")
         
@@ -39,12 +258,51 @@ class UpdateManager:
             logger.error(f"Failed to read version: {e}")
             return None, None
     
-    def get_latest_version(self):
-        """Check GitHub for latest version"""
+    def get_latest_version(self, fresh=False):
+        """Check GitHub for latest version (cached for UPDATE_CHECK_TTL seconds unless fresh)"""
+        # Concurrent callers wait for a single in-flight check and share its result
+        with self._latest_lock:
+            cached = None if fresh else self._latest_cache
+            if not cached and not fresh:
+                # Fresh process (e.g. restarted by an update): a just-applied commit is the remote HEAD
+                cached = self._last_applied()
+                self._latest_cache = cached
+            if cached and time.monotonic() - cached[1] < UPDATE_CHECK_TTL:
+                return cached[0]
+            
+            commit_hash = self._fetch_latest_version()
+            if commit_hash:
+                self._latest_cache = (commit_hash, time.monotonic())
+            return commit_hash
+    
+    def _last_applied(self):
+        """(commit_hash, monotonic timestamp) of the most recently applied update, if any"""
+        try:
+            with open(self.applied_cache) as f:
+                lines = f.read().split("\n")
+            commit_hash, applied_at = [line for line in lines if line][-1].split()
+            return commit_hash, time.monotonic() - (time.time() - float(applied_at))
+        except (OSError, IndexError, ValueError):
+            return None
+    
+    def _record_applied(self, commit_hash):
+        """Append an applied commit to the log, keeping the last APPLIED_COMMITS_LIMIT entries"""
         try:
-            # Get latest commit hash from GitHub
-            cmd = f"git ls-remote {self.repo_url} HEAD"
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=10)
+            with open(self.applied_cache) as f:
+                lines = [line for line in f.read().split("\n") if line]
+        except OSError:
+            lines = []
+        lines.append(f"{commit_hash} {time.time():.0f}")
+        with open(self.applied_cache, 'w') as f:
+            f.write("\n".join(lines[-APPLIED_COMMITS_LIMIT:]) + "\n")
+    
+    def _fetch_latest_version(self):
+        """Query the remote HEAD commit hash"""
+        try:
+            # Get latest commit hash from GitHub. Protocol v2 adds a capability
+            # round trip that only pays off for large ref sets; v1 is faster for one ref.
+            cmd = ["git", "-c", "protocol.version=1", "ls-remote", self.repo_url, "HEAD"]
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10, env=GIT_ENV)
             
             if result.returncode == 0:
                 commit_hash = result.stdout.split()[0]
@@ -55,11 +313,11 @@ class UpdateManager:
             logger.error(f"Failed to check GitHub: {e}")
             return None
     
-    def check_for_updates(self):
+    def check_for_updates(self, fresh=False):
         """Check if updates are available"""
         try:
             current_version, current_commit = self.get_current_version()
-            latest_commit = self.get_latest_version()
+            latest_commit = self.get_latest_version(fresh=fresh)
             
             logger.info(f"Current commit: {current_commit}")
             logger.info(f"Latest commit: {latest_commit}")
@@ -87,34 +345,88 @@ class UpdateManager:
                 "error": str(e)
             }
     
+    def _git_mirror(self, *args, timeout=60):
+        """Run a git command against the update mirror"""
+        cmd = ["git", f"--git-dir={self.mirror_dir}", *args]
+        return subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, env=GIT_ENV)
+    
+    def _ensure_mirror(self):
+        """Create the bare update mirror on first use"""
+        if os.path.exists(f"{self.mirror_dir}/HEAD"):
+            return
+        result = subprocess.run(["git", "init", "--bare", self.mirror_dir], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Git init failed: {result.stderr}")
+        self._git_mirror("remote", "add", "origin", self.repo_url)
+    
+    def _export_tree(self, commit, temp_dir):
+        """Write the commit's backend/frontend files (no .git, no index) to temp_dir via git archive"""
+        os.makedirs(temp_dir)
+        # git archive rejects pathspecs that match nothing, so only ask for paths the commit has
+        result = self._git_mirror("ls-tree", "--name-only", commit)
+        paths = [path for path in result.stdout.split() if path in UPDATE_PATHS]
+        if not paths:
+            raise Exception(f"Commit {commit} has none of: {', '.join(UPDATE_PATHS)}")
+        cmd = ["git", f"--git-dir={self.mirror_dir}", "archive", "--format=tar", commit, *paths]
+        archive = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=GIT_ENV)
+        tar_error = None
+        try:
+            with tarfile.open(fileobj=archive.stdout, mode="r|") as tar:
+                tar.extractall(temp_dir)
+        except tarfile.TarError as e:
+            tar_error = e
+        finally:
+            archive.stdout.close()
+            stderr = archive.stderr.read().decode(errors="replace")
+            archive.wait(timeout=60)
+        # A git failure leaves an empty/truncated stream; report git's error rather than tar's
+        if archive.returncode != 0:
+            raise Exception(f"Git archive failed: {stderr}")
+        if tar_error:
+            raise Exception(f"Extracting update failed: {tar_error}")
+    
+    def is_up_to_date(self, fresh=False):
+        """True only when the installed commit is known to match the remote HEAD"""
+        status = self.check_for_updates(fresh=fresh)
+        return not status.get("error") and status.get("update_available") is False
+    
     def create_backup(self):
         """Create backup of current installation"""
         try:
             timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-            backup_path = f"{self.backup_dir}/backup_{timestamp}"
+            backup_path = f"{self.backup_dir}/backup_{timestamp}{BACKUP_SUFFIX}"
             
             os.makedirs(self.backup_dir, exist_ok=True)
             
             logger.info(f"Creating backup at {backup_path}")
             logger.info(f"Backing up from: {self.app_dir}")
             
-            # Only backup if directories exist
-            if os.path.exists(f"{self.app_dir}/backend"):
-                shutil.copytree(
-                    f"{self.app_dir}/backend", 
-                    f"{backup_path}/backend", 
-                    ignore=shutil.ignore_patterns('__pycache__', '*.pyc', '.venv')
-                )
-            
-            if os.path.exists(f"{self.app_dir}/frontend"):
-                shutil.copytree(
-                    f"{self.app_dir}/frontend", 
-                    f"{backup_path}/frontend", 
-                    ignore=shutil.ignore_patterns('node_modules', 'build')
-                )
-            
-            if os.path.exists(self.version_file):
-                shutil.copy(self.version_file, f"{backup_path}/VERSION.json")
+            # Stream everything into one archive; rename at the end so a partial file is never listed
+            partial_path = f"{backup_path}.partial"
+            counter = {"files": 0}
+            with open(partial_path, 'wb') as raw:
+                out = _HashingWriter(raw)
+                with tarfile.open(fileobj=out, mode="w:gz", compresslevel=BACKUP_COMPRESS_LEVEL) as tar:
+                    # Only backup if directories exist
+                    for name, patterns in BACKUP_EXCLUDES.items():
+                        if os.path.exists(f"{self.app_dir}/{name}"):
+                            tar.add(f"{self.app_dir}/{name}", arcname=name, filter=_exclude_filter(patterns, counter))
+                    
+                    if os.path.exists(self.version_file):
+                        tar.add(self.version_file, arcname="VERSION.json")
+                        counter["files"] += 1
+                size_bytes = raw.tell()
+            
+            # Sidecar manifest: list_backups reads it instead of touching the archive,
+            # and rollback checks the hash before extracting
+            with open(self._manifest_path(backup_path), 'w') as f:
+                json.dump({
+                    "size_bytes": size_bytes,
+                    "file_count": counter["files"],
+                    "created": datetime.utcnow().isoformat(),
+                    "sha256": out.hash.hexdigest()
+                }, f)
+            os.replace(partial_path, backup_path)
             
             logger.info(f"✓ Backup created: {backup_path}")
             return backup_path
@@ -123,92 +435,43 @@ class UpdateManager:
             logger.error(f"Backup failed: {e}")
             raise Exception(f"Failed to create backup: {e}")
     
-    def apply_update(self, backup_path=None):
-        """SAFE UPDATE: Overlay files without deleting infrastructure"""
+    def _clone_to_temp(self, temp_dir=UPDATE_TEMP_DIR):
+        """Fetch the latest commit and export its files to temp_dir; returns the commit hash"""
+        if os.path.exists(temp_dir):
+            _fast_rmtree(temp_dir)
+        
+        logger.info(f"Fetching from {self.repo_url}")
+        self._ensure_mirror()
+        result = self._git_mirror("fetch", "--depth=1", "origin", "HEAD")
+        if result.returncode != 0:
+            raise Exception(f"Git fetch failed: {result.stderr}")
+        
+        result = self._git_mirror("rev-parse", "FETCH_HEAD")
+        new_commit = result.stdout.strip()
+        self._export_tree(new_commit or "FETCH_HEAD", temp_dir)
+        if new_commit:
+            with self._latest_lock:
+                self._latest_cache = (new_commit, time.monotonic())
+        
+        logger.info(f"Downloaded commit: {new_commit}")
+        return new_commit
+    
+    def apply_update(self, backup_path=None, new_commit=None):
+        """SAFE UPDATE: Overlay files without deleting infrastructure
+        
+        new_commit is passed when _clone_to_temp already fetched the tree (see run_update).
+        """
         try:
             logger.info("Starting SAFE update process...")
             
-            temp_dir = "/tmp/iptvbcms_update"
-            
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-            
-            logger.info(f"Cloning from {self.repo_url}")
-            cmd = f"git clone --depth 1 {self.repo_url} {temp_dir}"
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=60)
-            
-            if result.returncode != 0:
-                raise Exception(f"Git clone failed: {result.stderr}")
-            
-            cmd = f"cd {temp_dir} && git rev-parse HEAD"
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-            new_commit = result.stdout.strip()
-            
-            logger.info(f"Downloaded commit: {new_commit}")
-            
-            # SAFE OVERLAY METHOD - Never delete .venv, node_modules, .env
-            logger.info("Overlaying backend files...")
-            if os.path.exists(f"{temp_dir}/backend"):
-                for root, dirs, files in os.walk(f"{temp_dir}/backend"):
-                    # Skip git directories
-                    dirs[:] = [d for d in dirs if d not in ['.git', '__pycache__']]
-                    
-                    rel_path = os.path.relpath(root, f"{temp_dir}/backend")
-                    target_dir = f"{self.app_dir}/backend/{rel_path}" if rel_path != '.' else f"{self.app_dir}/backend"
-                    os.makedirs(target_dir, exist_ok=True)
-                    
-                    for file in files:
-                        if file not in ['.env']:
-                            src = os.path.join(root, file)
-                            dst = os.path.join(target_dir, file)
-                            shutil.copy2(src, dst)
-            
-            logger.info("Overlaying frontend files...")
-            if os.path.exists(f"{temp_dir}/frontend"):
-                for root, dirs, files in os.walk(f"{temp_dir}/frontend"):
-                    dirs[:] = [d for d in dirs if d not in ['node_modules', 'build', '.git', '__pycache__']]
-                    
-                    rel_path = os.path.relpath(root, f"{temp_dir}/frontend")
-                    target_dir = f"{self.app_dir}/frontend/{rel_path}" if rel_path != '.' else f"{self.app_dir}/frontend"
-                    os.makedirs(target_dir, exist_ok=True)
-                    
-                    for file in files:
-                        if file not in ['.env']:
-                            src = os.path.join(root, file)
-                            dst = os.path.join(target_dir, file)
-                            shutil.copy2(src, dst)
-                
-                # Rebuild frontend for production
-                logger.info("Rebuilding frontend...")
-                cmd = f"cd {self.app_dir}/frontend && yarn build"
-                result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=300)
-                
-                if result.returncode != 0:
-                    logger.warning(f"Frontend build had warnings: {result.stderr}")
-                else:
-                    logger.info("✓ Frontend rebuilt successfully")
-            
-            # Update version file
-            version_data = {
-                "version": datetime.utcnow().strftime("%Y.%m.%d.%H%M"),
-                "commit_hash": new_commit,
-                "updated_at": datetime.utcnow().isoformat()
-            }
+            if new_commit is None:
+                # Applying must see a push made since the last cached check
+                if self.is_up_to_date(fresh=True):
+                    logger.info("Already up to date, skipping update")
+                    return {"success": True, "message": "already up to date", "noop": True}
+                new_commit = self._clone_to_temp()
             
-            with open(self.version_file, 'w') as f:
-                json.dump(version_data, f, indent=2)
-            
-            shutil.rmtree(temp_dir)
-            
-            # DON'T restart here - let the API respond first
-            logger.info("✓ Update applied successfully (safe overlay mode)")
-            logger.info("Services will be restarted by API endpoint after response is sent")
-            
-            return {
-                "success": True,
-                "version": version_data,
-                "message": "Update applied successfully. Services restarting..."
-            }
+            return self._apply_from_temp(UPDATE_TEMP_DIR, new_commit, backup_path)
             
         except Exception as e:
             logger.error(f"Update failed: {e}")
@@ -228,33 +491,173 @@ class UpdateManager:
                 "rolled_back": False
             }
     
+    def _apply_from_temp(self, temp_dir, new_commit, backup_path=None):
+        """Overlay a fetched tree onto the install, rebuild the frontend and record the version"""
+        # SAFE OVERLAY METHOD - Never delete .venv, node_modules, .env
+        logger.info("Overlaying backend files...")
+        if os.path.exists(f"{temp_dir}/backend"):
+            self._swap_in_backend(f"{temp_dir}/backend", backup_path)
+        
+        logger.info("Overlaying frontend files...")
+        if os.path.exists(f"{temp_dir}/frontend"):
+            _overlay_tree(
+                f"{temp_dir}/frontend", f"{self.app_dir}/frontend",
+                skip_dirs=('node_modules', 'build', '.git', '__pycache__'), skip_files=('.env',)
+            )
+            
+            # Rebuild frontend for production
+            logger.info("Rebuilding frontend...")
+            result = subprocess.run(
+                ["yarn", "build"], cwd=f"{self.app_dir}/frontend",
+                capture_output=True, text=True, timeout=300
+            )
+            
+            if result.returncode != 0:
+                logger.warning(f"Frontend build had warnings: {result.stderr}")
+            else:
+                logger.info("✓ Frontend rebuilt successfully")
+        
+        # Update version file
+        version_data = {
+            "version": datetime.utcnow().strftime("%Y.%m.%d.%H%M"),
+            "commit_hash": new_commit,
+            "updated_at": datetime.utcnow().isoformat()
+        }
+        
+        with open(self.version_file, 'w') as f:
+            json.dump(version_data, f, indent=2)
+        if new_commit:
+            self._record_applied(new_commit)
+        
+        _fast_rmtree(temp_dir)
+        
+        # DON'T restart here - let the API respond first
+        logger.info("✓ Update applied successfully (safe overlay mode)")
+        logger.info("Services will be restarted by API endpoint after response is sent")
+        
+        return {
+            "success": True,
+            "version": version_data,
+            "message": "Update applied successfully. Services restarting..."
+        }
+    
+    def _swap_in_backend(self, src_backend, backup_path=None):
+        """Stage the updated backend beside the live one, then swap it in with one rename
+        
+        The stage starts as a hard-link copy of the live tree (keeping venv, .env, uploads),
+        and the new files replace links rather than writing through them, so the running
+        backend never sees a half-updated tree. The old tree is kept as backend.old so
+        rollback can swap it straight back.
+        """
+        backend = f"{self.app_dir}/backend"
+        staging = f"{self.app_dir}/backend.staging"
+        old = f"{self.app_dir}/backend.old"
+        
+        if not os.path.exists(backend):
+            _overlay_tree(src_backend, backend, skip_dirs=('.git', '__pycache__'), skip_files=('.env',))
+            return
+        
+        for leftover in (staging, old):
+            if os.path.exists(leftover):
+                _fast_rmtree(leftover)
+        
+        # Margin for filesystems with coarse mtimes
+        snapshot_at = time.time() - 1
+        subprocess.run(["cp", "-al", backend, staging], check=True)
+        _overlay_tree(src_backend, staging, skip_dirs=('.git', '__pycache__'), skip_files=('.env',))
+        
+        if _exchange_paths(staging, backend):
+            os.rename(staging, old)
+        else:
+            os.rename(backend, old)
+            os.rename(staging, backend)
+        # Uploads, invoices and settings saved while the stage was built went to the old tree
+        _carry_over(old, backend, BACKEND_DATA_PATHS, snapshot_at)
+        logger.info("✓ Backend swapped in")
+        
+        if backup_path:
+            with open(f"{old}/{ROLLBACK_MARKER}", 'w') as f:
+                f.write(os.path.basename(backup_path))
+    
+    def _swap_back_backend(self, backup_path):
+        """Swap in the backend.old kept by the update that made backup_path; False if there is none"""
+        backend = f"{self.app_dir}/backend"
+        old = f"{self.app_dir}/backend.old"
+        marker = f"{old}/{ROLLBACK_MARKER}"
+        try:
+            with open(marker) as f:
+                kept_for = f.read().strip()
+            swapped_at = os.stat(marker).st_mtime - 1
+        except OSError:
+            return False
+        if kept_for != os.path.basename(backup_path) or not os.path.exists(backend):
+            return False
+        
+        os.remove(marker)
+        if _exchange_paths(old, backend):
+            failed = old
+        else:
+            failed = f"{self.app_dir}/backend.failed"
+            if os.path.exists(failed):
+                _fast_rmtree(failed)
+            os.rename(backend, failed)
+            os.rename(old, backend)
+        # Keep data written since the update swapped the new backend in
+        _carry_over(failed, backend, BACKEND_DATA_PATHS, swapped_at)
+        logger.info("✓ Previous backend swapped back in")
+        
+        threading.Thread(target=_fast_rmtree, args=(failed,), daemon=True).start()
+        return True
+    
+    def run_update(self):
+        """Backup and apply the latest update; only one run at a time (across processes too)"""
+        with open(self.lock_path, 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.warning("Update requested while another update is running")
+                return {"success": False, "error": "update already in progress"}
+            
+            # Applying must see a push made since the last cached check
+            if self.is_up_to_date(fresh=True):
+                return {"success": True, "message": "already up to date", "noop": True}
+            
+            # Backup (local disk) and fetch (network) are independent, so overlap them
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                backup_future = executor.submit(self.create_backup)
+                fetch_future = executor.submit(self._clone_to_temp)
+                backup_path = backup_future.result()
+                try:
+                    new_commit = fetch_future.result()
+                except Exception as e:
+                    # Nothing was overlaid yet, so there is nothing to roll back
+                    logger.error(f"Update failed: {e}")
+                    return {"success": False, "error": str(e), "rolled_back": False}
+            
+            return self.apply_update(backup_path, new_commit)
+    
     def rollback(self, backup_path):
         """Restore from backup - SAFE: overlay only"""
         try:
             logger.info(f"Restoring from backup: {backup_path}")
             
-            # SAFE: Just copy backup files over existing (don't delete anything)
-            if os.path.exists(f"{backup_path}/backend"):
-                for root, dirs, files in os.walk(f"{backup_path}/backend"):
-                    rel_path = os.path.relpath(root, f"{backup_path}/backend")
-                    target_dir = f"{self.app_dir}/backend/{rel_path}" if rel_path != '.' else f"{self.app_dir}/backend"
-                    os.makedirs(target_dir, exist_ok=True)
-                    
-                    for file in files:
-                        src = os.path.join(root, file)
-                        dst = os.path.join(target_dir, file)
-                        shutil.copy2(src, dst)
-            
-            if os.path.exists(f"{backup_path}/frontend"):
-                for root, dirs, files in os.walk(f"{backup_path}/frontend"):
-                    rel_path = os.path.relpath(root, f"{backup_path}/frontend")
-                    target_dir = f"{self.app_dir}/frontend/{rel_path}" if rel_path != '.' else f"{self.app_dir}/frontend"
-                    os.makedirs(target_dir, exist_ok=True)
-                    
-                    for file in files:
-                        src = os.path.join(root, file)
-                        dst = os.path.join(target_dir, file)
-                        shutil.copy2(src, dst)
+            if os.path.isfile(backup_path) and not self._backup_intact(backup_path):
+                return False
+            
+            # The backend the update replaced is usually still on disk: one rename restores it
+            restore = ("frontend",) if self._swap_back_backend(backup_path) else ("backend", "frontend")
+            
+            # SAFE: Just extract/copy backup files over existing (don't delete anything)
+            if os.path.isfile(backup_path):
+                skip_roots = () if "backend" in restore else ("backend",)
+                self.extract_backup(backup_path, skip_roots=skip_roots, verify=False)
+                logger.info("✓ Rollback completed")
+                return True
+            
+            # Older backups are plain directory copies
+            for name in restore:
+                if os.path.exists(f"{backup_path}/{name}"):
+                    _overlay_tree(f"{backup_path}/{name}", f"{self.app_dir}/{name}")
             
             if os.path.exists(f"{backup_path}/VERSION.json"):
                 shutil.copy(f"{backup_path}/VERSION.json", self.version_file)
@@ -266,17 +669,68 @@ class UpdateManager:
             logger.error(f"Rollback failed: {e}")
             return False
     
+    def _backup_intact(self, backup_path):
+        """False when a backup archive no longer matches its manifest hash"""
+        manifest = self._read_manifest(backup_path)
+        if manifest and manifest.get("sha256") and _file_sha256(backup_path) != manifest["sha256"]:
+            logger.error(f"Backup {backup_path} does not match its manifest hash, not restoring")
+            return False
+        return True
+    
+    def extract_backup(self, backup_path, skip_files=(), skip_roots=(), verify=True):
+        """Extract a backup archive over app_dir after checking its manifest hash; False on mismatch"""
+        if verify and not self._backup_intact(backup_path):
+            return False
+        with tarfile.open(backup_path, "r|gz") as tar:
+            for member in tar:
+                if member.name.split("/", 1)[0] in skip_roots:
+                    continue
+                if os.path.basename(member.name) not in skip_files:
+                    tar.extract(member, self.app_dir)
+        return True
+    
     def restart_services(self):
         """Restart backend and frontend services"""
         try:
             logger.info("Restarting services...")
-            subprocess.run("supervisorctl restart backend frontend", shell=True, timeout=30)
-            logger.info("✓ Services restarted")
+            # Detached so the restart completes even though it kills this backend process
+            subprocess.Popen(
+                ["supervisorctl", "restart", "backend", "frontend"],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True
+            )
+            logger.info("✓ Service restart requested")
             return True
         except Exception as e:
             logger.error(f"Failed to restart services: {e}")
             return False
     
+    def _manifest_path(self, backup_path):
+        """Manifest location: beside an archive, or inside an older directory backup"""
+        if backup_path.endswith(BACKUP_SUFFIX):
+            return f"{backup_path}.{BACKUP_MANIFEST}"
+        return f"{backup_path}/{BACKUP_MANIFEST}"
+    
+    def _read_manifest(self, backup_path):
+        """Backup manifest dict, or None when missing/unreadable"""
+        try:
+            with open(self._manifest_path(backup_path)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def delete_backup(self, backup_path):
+        """Delete a backup archive (and its manifest) or an older directory backup"""
+        if os.path.isfile(backup_path):
+            os.remove(backup_path)
+            manifest_path = self._manifest_path(backup_path)
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+        else:
+            _fast_rmtree(backup_path)
+    
     def list_backups(self):
         """List available backups"""
         try:
@@ -286,13 +740,20 @@ class UpdateManager:
             backups = []
             for item in os.listdir(self.backup_dir):
                 backup_path = f"{self.backup_dir}/{item}"
-                if os.path.isdir(backup_path):
-                    stat = os.stat(backup_path)
+                if item.endswith(BACKUP_SUFFIX) or os.path.isdir(backup_path):
+                    manifest = self._read_manifest(backup_path) or {}
+                    if "size_bytes" in manifest and "created" in manifest:
+                        created, size_bytes = manifest["created"], manifest["size_bytes"]
+                    else:
+                        stat = os.stat(backup_path)
+                        created = datetime.fromtimestamp(stat.st_ctime).isoformat()
+                        size_bytes = stat.st_size if os.path.isfile(backup_path) else _tree_size(backup_path)
                     backups.append({
                         "name": item,
                         "path": backup_path,
-                        "created": datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                        "size_mb": sum(f.stat().st_size for f in Path(backup_path).rglob('*') if f.is_file()) / (1024 * 1024)
+                        "created": created,
+                        "size_mb": size_bytes / (1024 * 1024),
+                        "file_count": manifest.get("file_count")
                     })
             
             return sorted(backups, key=lambda x: x['created'], reverse=True)
@@ -1,45 +1,272 @@
+import asyncio
+import hashlib
+import os
+import httpx
 import requests
-from bs4 import BeautifulSoup
-import json
-from typing import Dict, Any, List
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+import re
+import html
+from bs4 import BeautifulSoup, SoupStrainer
+import orjson
+from typing import Dict, Any, List, Optional, Tuple
 import logging
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 logger = logging.getLogger(__name__)
 
+# Concurrent get_package calls per fetch
+FETCH_WORKERS = 10
+# Keep-alive connections held per panel session
+POOL_MAXSIZE = 32
+# Seconds a parsed package dropdown is reused
+PACKAGE_OPTIONS_TTL = 30
+# Seconds a get_package response is reused
+PACKAGE_DETAIL_TTL = 60
+# PHPSESSID cookies kept here so restarts can skip the login POST; outside
+# the app tree so update backups never capture live session tokens
+SESSION_COOKIE_DIR = os.environ.get(
+    'PANEL_SESSION_DIR', os.path.join(tempfile.gettempdir(), 'xtream_panel_sessions')
+)
+# Read size while streaming user_reseller.php up to the package dropdown
+PAGE_CHUNK_SIZE = 16384
+
+# Only the package dropdown is read from user_reseller.php
+_PACKAGE_STRAINER = SoupStrainer('select', id='package')
+_SELECT_RE = re.compile(r'<select[^>]*id=["\']package["\'][^>]*>(.*?)</select>', re.DOTALL | re.IGNORECASE)
+_OPTION_RE = re.compile(r'<option[^>]*value=["\'](\d+)["\'][^>]*>([^<]*)</option>', re.IGNORECASE)
+_SELECT_START_RE = re.compile(rb'<select[^>]*id=["\']package["\']', re.IGNORECASE)
+_NUM_RE = re.compile(r'^-?\d+(?:\.\d+)?$')
+_INT_RE = re.compile(r'^\d+$')
+
+
+def _package_select_complete(buf: bytearray) -> bool:
+    """Whether the streamed page already contains the whole package dropdown"""
+    match = _SELECT_START_RE.search(buf)
+    return match is not None and buf.find(b'</select>', match.end()) != -1
+
+
+def _extract_package_options(page_html: str) -> Optional[List[Tuple[str, str]]]:
+    """Return (id, name) pairs from the package dropdown, or None if it is missing"""
+    match = _SELECT_RE.search(page_html)
+    if match:
+        options = _OPTION_RE.findall(match.group(1))
+        if options:
+            return [(pid, html.unescape(name).strip()) for pid, name in options]
+
+    # Fall back to bs4 for markup the patterns don't cover
+    soup = BeautifulSoup(page_html, 'lxml', parse_only=_PACKAGE_STRAINER)
+    package_select = soup.find('select', {'id': 'package'})
+    if not package_select:
+        return None
+    return [
+        (opt.get('value'), opt.text.strip())
+        for opt in package_select.find_all('option')
+        if opt.get('value') and opt.get('value').isdigit()
+    ]
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose sockets disable Nagle and send TCP keepalives"""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        ]
+        super().init_poolmanager(*args, **kwargs)
+
+
+# Transient gateway errors are retried for reads only; form POSTs create accounts
+_PANEL_RETRY = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=[502, 503, 504],
+    allowed_methods=['GET', 'HEAD'],
+    raise_on_status=False,
+)
+
+
+def mount_panel_adapter(session: requests.Session):
+    """Mount the pooled keepalive adapter and panel headers on a requests session"""
+    adapter = _KeepAliveAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE, max_retries=_PANEL_RETRY)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Connection': 'keep-alive', 'Accept-Encoding': 'gzip, deflate'})
+
+
+_SESSIONS: Dict[Tuple[str, str, str, bool], requests.Session] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def get_shared_session(panel_url: str, http_user: str, http_pass: str, verify: bool = False) -> requests.Session:
+    """Return the process-wide requests session for a panel and credential pair"""
+    key = (panel_url.rstrip('/'), http_user, http_pass, verify)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = requests.Session()
+            session.auth = (http_user, http_pass)
+            session.verify = verify
+            mount_panel_adapter(session)
+            _SESSIONS[key] = session
+        return session
+
+
+# First package id seen per panel, fetched speculatively alongside the package page
+_FIRST_PACKAGE_IDS: Dict[str, int] = {}
+
+# Panels that answered get_trial_packages with something other than a package list
+_NO_TRIAL_LIST_API: set = set()
+
+
+def _trial_options_from_api(data) -> Optional[List[Tuple[str, str]]]:
+    """Return (id, name) pairs from a get_trial_packages response, or None if it isn't a package list"""
+    if isinstance(data, dict):
+        if data.get('result') is False:
+            return None
+        data = data.get('data', data.get('packages'))
+    if not isinstance(data, list) or not data:
+        return None
+    options = []
+    for item in data:
+        if not isinstance(item, dict) or not str(item.get('id', '')).isdigit():
+            return None
+        options.append((str(item['id']), item.get('package_name') or ''))
+    return options
+
+
+def _session_cookie_path(panel_url: str, username: str) -> str:
+    key = hashlib.sha256(f"{panel_url}\0{username}".encode()).hexdigest()[:32]
+    return os.path.join(SESSION_COOKIE_DIR, key)
+
+
+def load_session_cookie(panel_url: str, username: str) -> Optional[str]:
+    """Return the PHPSESSID persisted for a panel login, if any"""
+    try:
+        with open(_session_cookie_path(panel_url, username)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def save_session_cookie(panel_url: str, username: str, session_id: Optional[str]):
+    """Persist a panel PHPSESSID so the next process can reuse it"""
+    if not session_id:
+        return
+    path = _session_cookie_path(panel_url, username)
+    try:
+        os.makedirs(SESSION_COOKIE_DIR, mode=0o700, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(session_id)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not persist panel session: {e}")
+
+
+def _split_panel_url(panel_url: str, username: str, password: str) -> Tuple[str, str, str]:
+    """Strip embedded credentials from the panel URL and return (url, http_user, http_pass)"""
+    if '@' in panel_url:
+        parts = panel_url.split('@')
+        if len(parts) == 2:
+            protocol = parts[0].split('//')[0]
+            # Use embedded credentials
+            cred_part = parts[0].split('//')[1]
+            if ':' in cred_part:
+                http_user, http_pass = cred_part.split(':', 1)
+            else:
+                http_user, http_pass = username, password
+            return f"{protocol}//{parts[1]}".rstrip('/'), http_user, http_pass
+    return panel_url.rstrip('/'), username, password
+
+
+def _package_from_response(package_id: str, package_name: str, data: Dict) -> Optional[Dict]:
+    """Build a regular package entry from a get_package response"""
+    if data.get('result') != True:
+        return None
+    return {
+        'id': int(package_id),
+        'name': package_name,
+        'credits': data['data'].get('cost_credits', 0),
+        'duration': data['data'].get('official_duration', 0),
+        'duration_unit': data['data'].get('official_duration_in', 'months'),
+        'max_connections': data['data'].get('max_connections', 1),
+        'bouquets': data.get('bouquets', [])
+    }
+
+
+def _trial_package_from_response(package_id: int, package_name: str, data: Dict) -> Optional[Dict]:
+    """Build a trial package entry from a get_package_trial response"""
+    if data.get('result') != True:
+        return None
+    package_data = data.get('data', {})
+    
+    # Get trial duration
+    trial_duration = package_data.get('trial_duration', 0)
+    if isinstance(trial_duration, str):
+        trial_duration = int(trial_duration) if _INT_RE.match(trial_duration) else 0
+    else:
+        trial_duration = int(trial_duration or 0)
+    
+    trial_credits = package_data.get('cost_credits', 0)
+    if isinstance(trial_credits, str):
+        trial_credits = float(trial_credits) if _NUM_RE.match(trial_credits) else 0
+    else:
+        trial_credits = float(trial_credits or 0)
+    
+    return {
+        'id': int(package_id),
+        'name': package_name or package_data.get('package_name') or f"Package {package_id}",
+        'credits': trial_credits,
+        'duration': trial_duration,
+        'duration_unit': package_data.get('trial_duration_in', 'days'),
+        'max_connections': package_data.get('max_connections', 1),
+        'bouquets': data.get('bouquets', []),
+        'is_trial': True
+    }
+
+
 class XtreamUISessionClient:
     """XtreamUI Admin/Reseller Panel Client with Session Authentication"""
     
-    def __init__(self, panel_url: str, username: str, password: str):
-        # Remove embedded credentials from URL if present
-        if '@' in panel_url:
-            parts = panel_url.split('@')
-            if len(parts) == 2:
-                protocol = parts[0].split('//')[0]
-                self.panel_url = f"{protocol}//{parts[1]}"
-                # Use embedded credentials
-                cred_part = parts[0].split('//')[1]
-                if ':' in cred_part:
-                    self.http_user, self.http_pass = cred_part.split(':', 1)
-                else:
-                    self.http_user, self.http_pass = username, password
-            else:
-                self.panel_url = panel_url
-                self.http_user, self.http_pass = username, password
-        else:
-            self.panel_url = panel_url
-            self.http_user, self.http_pass = username, password
-        
-        self.panel_url = self.panel_url.rstrip('/')
+    def __init__(self, panel_url: str, username: str, password: str, eager_login: bool = False):
+        self.panel_url, self.http_user, self.http_pass = _split_panel_url(panel_url, username, password)
         self.username = username
         self.password = password
-        self.session = requests.Session()
-        self.session.auth = (self.http_user, self.http_pass)
-        self.session.verify = False
+        self.session = get_shared_session(self.panel_url, self.http_user, self.http_pass)
         self.logged_in = False
+        self._pkg_cache: Dict[bool, Tuple[List[Tuple[str, str]], float]] = {}
+        self._pkg_detail_cache: Dict[int, Tuple[float, Dict]] = {}
+        if eager_login:
+            self.login()
+    
+    def _resume_session(self) -> bool:
+        """Reuse a live or persisted PHPSESSID if the panel still accepts it"""
+        if 'PHPSESSID' not in self.session.cookies:
+            session_id = load_session_cookie(self.panel_url, self.username)
+            if not session_id:
+                return False
+            self.session.cookies.set('PHPSESSID', session_id)
+        try:
+            response = self.session.head(f"{self.panel_url}/user_reseller.php", allow_redirects=False, timeout=10)
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
     
     def login(self) -> bool:
         """Login to XtreamUI panel"""
         try:
+            if self._resume_session():
+                self.logged_in = True
+                return True
+            
+            self.session.cookies.pop('PHPSESSID', None)
             response = self.session.post(
                 f"{self.panel_url}/login.php",
                 data={'username': self.username, 'password': self.password},
@@ -49,6 +276,7 @@ class XtreamUISessionClient:
             
             if 'PHPSESSID' in self.session.cookies:
                 self.logged_in = True
+                save_session_cookie(self.panel_url, self.username, self.session.cookies.get('PHPSESSID'))
                 logger.info(f"Logged in to XtreamUI panel as {self.username}")
                 return True
             
@@ -57,6 +285,75 @@ class XtreamUISessionClient:
             logger.error(f"XtreamUI login failed: {e}")
             return False
     
+    def _get_package_options(self, trial: bool = False) -> Optional[List[Tuple[str, str]]]:
+        """Fetch and parse the reseller package dropdown, reusing it for PACKAGE_OPTIONS_TTL"""
+        cached = self._pkg_cache.get(trial)
+        if cached and time.monotonic() - cached[1] < PACKAGE_OPTIONS_TTL:
+            return cached[0]
+        
+        page = "user_reseller.php?trial" if trial else "user_reseller.php"
+        # The user tables after the dropdown can be large, so stop reading once it is closed
+        with self.session.get(f"{self.panel_url}/{page}", stream=True, timeout=30) as page_response:
+            buf = bytearray()
+            if page_response.status_code == 200:
+                for chunk in page_response.iter_content(chunk_size=PAGE_CHUNK_SIZE):
+                    buf += chunk
+                    if _package_select_complete(buf):
+                        break
+            encoding = page_response.encoding or 'utf-8'
+        
+        if page_response.status_code != 200 or not buf:
+            logger.warning(f"Could not access {page}")
+            return None
+        
+        options = _extract_package_options(buf.decode(encoding, errors='replace'))
+        
+        if options is None:
+            logger.warning(f"No package select found on {page}")
+            return None
+        
+        self._pkg_cache[trial] = (options, time.monotonic())
+        return options
+    
+    def _get_trial_package_options(self) -> Optional[List[Tuple[str, str]]]:
+        """List trial packages through the panel API, falling back to scraping user_reseller.php?trial"""
+        if self.panel_url not in _NO_TRIAL_LIST_API:
+            try:
+                api_response = self.session.get(f"{self.panel_url}/api.php?action=get_trial_packages", timeout=5)
+                options = _trial_options_from_api(orjson.loads(api_response.content)) if api_response.status_code == 200 else None
+            except (requests.RequestException, orjson.JSONDecodeError):
+                options = None
+            if options is not None:
+                return options
+            _NO_TRIAL_LIST_API.add(self.panel_url)
+        
+        return self._get_package_options(trial=True)
+    
+    def _fetch_package_detail(self, package_id, ttl: float = PACKAGE_DETAIL_TTL) -> Optional[Dict]:
+        """Return the get_package response for a package, reusing successful ones for ttl seconds"""
+        package_id = int(package_id)
+        cached = self._pkg_detail_cache.get(package_id)
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+        
+        api_response = self.session.get(
+            f"{self.panel_url}/api.php?action=get_package&package_id={package_id}",
+            timeout=10
+        )
+        
+        if api_response.status_code != 200:
+            return None
+        
+        try:
+            data = orjson.loads(api_response.content)
+        except orjson.JSONDecodeError:
+            logger.warning(f"Package {package_id} returned a non-JSON response")
+            return None
+        
+        if data.get('result') == True:
+            self._pkg_detail_cache[package_id] = (time.monotonic(), data)
+        return data
+    
     def fetch_bouquets_from_packages(self) -> List[Dict]:
         """Fetch bouquets by scraping packages from reseller panel"""
         if not self.logged_in:
@@ -64,24 +361,21 @@ class XtreamUISessionClient:
                 return []
         
         try:
-            # Get user creation page
-            page_response = self.session.get(f"{self.panel_url}/user_reseller.php", timeout=30)
-            
-            if page_response.status_code != 200 or len(page_response.text) == 0:
-                logger.warning("Could not access user_reseller.php page")
-                return []
-            
-            # Parse HTML
-            soup = BeautifulSoup(page_response.text, 'html.parser')
-            package_select = soup.find('select', {'id': 'package'})
+            speculative_id = _FIRST_PACKAGE_IDS.get(self.panel_url)
+            if speculative_id is not None and speculative_id not in self._pkg_detail_cache:
+                # Warm the detail cache for last time's first package while the page loads
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    options_future = executor.submit(self._get_package_options)
+                    executor.submit(self._fetch_package_detail, speculative_id)
+                    options = options_future.result()
+            else:
+                options = self._get_package_options()
             
-            if not package_select:
-                logger.warning("No package select found")
+            if options is None:
                 return []
             
             # Get package IDs
-            options = package_select.find_all('option')
-            package_ids = [opt.get('value') for opt in options if opt.get('value') and opt.get('value').isdigit()]
+            package_ids = [package_id for package_id, _ in options]
             
             if not package_ids:
                 logger.warning("No package IDs found")
@@ -91,15 +385,11 @@ class XtreamUISessionClient:
             
             # Fetch bouquets from first package (they usually all have same bouquets)
             first_package_id = package_ids[0]
+            _FIRST_PACKAGE_IDS[self.panel_url] = int(first_package_id)
             
-            api_response = self.session.get(
-                f"{self.panel_url}/api.php?action=get_package&package_id={first_package_id}",
-                timeout=10
-            )
+            data = self._fetch_package_detail(first_package_id)
             
-            if api_response.status_code == 200:
-                data = api_response.json()
-                
+            if data:
                 if data.get('result') == True and 'bouquets' in data:
                     bouquets = data['bouquets']
                     logger.info(f"Fetched {len(bouquets)} bouquets from package {first_package_id}")
@@ -128,49 +418,26 @@ class XtreamUISessionClient:
                 return []
         
         try:
-            # Get user creation page
-            page_response = self.session.get(f"{self.panel_url}/user_reseller.php", timeout=30)
-            
-            if page_response.status_code != 200:
-                return []
+            options = self._get_package_options()
             
-            # Parse HTML
-            soup = BeautifulSoup(page_response.text, 'html.parser')
-            package_select = soup.find('select', {'id': 'package'})
-            
-            if not package_select:
+            if options is None:
                 return []
             
-            # Extract packages
-            packages = []
-            options = package_select.find_all('option')
-            
-            for option in options:
-                package_id = option.get('value')
-                package_name = option.text.strip()
+            def fetch_package_details(package_id, package_name):
+                """Fetch package details"""
+                try:
+                    data = self._fetch_package_detail(package_id)
+                    if data:
+                        return _package_from_response(package_id, package_name, data)
+                except:
+                    pass
                 
-                if package_id and package_id.isdigit():
-                    # Fetch package details
-                    api_response = self.session.get(
-                        f"{self.panel_url}/api.php?action=get_package&package_id={package_id}",
-                        timeout=10
-                    )
-                    
-                    if api_response.status_code == 200:
-                        try:
-                            data = api_response.json()
-                            if data.get('result') == True:
-                                packages.append({
-                                    'id': int(package_id),
-                                    'name': package_name,
-                                    'credits': data['data'].get('cost_credits', 0),
-                                    'duration': data['data'].get('official_duration', 0),
-                                    'duration_unit': data['data'].get('official_duration_in', 'months'),
-                                    'max_connections': data['data'].get('max_connections', 1),
-                                    'bouquets': data.get('bouquets', [])
-                                })
-                        except:
-                            pass
+                return None
+            
+            # Fetch details for all packages in parallel, keeping dropdown order
+            with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+                results = executor.map(lambda option: fetch_package_details(*option), options)
+                packages = [result for result in results if result]
             
             return packages
             
@@ -181,45 +448,27 @@ class XtreamUISessionClient:
     def fetch_trial_packages(self) -> List[Dict]:
         """Fetch trial packages that the reseller has access to
         
-        Uses user_reseller.php?trial to get the list of trial packages
-        assigned to this reseller account.
+        Lists the trial packages assigned to this reseller account through
+        api.php?action=get_trial_packages, or user_reseller.php?trial on
+        panels without that endpoint.
         """
         if not self.logged_in:
             if not self.login():
                 return []
         
         try:
-            # Get trial package IDs from user_reseller.php?trial
-            page_response = self.session.get(f"{self.panel_url}/user_reseller.php?trial", timeout=30)
+            options = self._get_trial_package_options()
             
-            if page_response.status_code != 200:
-                logger.warning(f"Could not access user_reseller.php?trial")
-                return []
-            
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(page_response.text, 'html.parser')
-            package_select = soup.find('select', {'id': 'package'})
-            
-            if not package_select:
-                logger.warning("No package select found on trial page")
+            if options is None:
                 return []
             
             # Get trial package IDs and names
-            options = package_select.find_all('option')
-            trial_package_map = {}
-            
-            for opt in options:
-                pkg_id = opt.get('value')
-                if pkg_id and pkg_id.isdigit():
-                    trial_package_map[int(pkg_id)] = opt.text.strip()
+            trial_package_map = {int(pkg_id): pkg_name for pkg_id, pkg_name in options}
             
             logger.info(f"Found {len(trial_package_map)} trial packages accessible to this reseller")
             
             packages = []
             
-            # Use threading for parallel requests
-            from concurrent.futures import ThreadPoolExecutor, as_completed
-            
             def fetch_trial_details(package_id, package_name):
                 """Fetch trial package details"""
                 try:
@@ -229,41 +478,14 @@ class XtreamUISessionClient:
                     )
                     
                     if api_response.status_code == 200:
-                        data = api_response.json()
-                        
-                        if data.get('result') == True:
-                            package_data = data.get('data', {})
-                            
-                            # Get trial duration
-                            trial_duration = package_data.get('trial_duration', 0)
-                            if isinstance(trial_duration, str):
-                                trial_duration = int(trial_duration) if trial_duration.isdigit() else 0
-                            else:
-                                trial_duration = int(trial_duration) if trial_duration else 0
-                            
-                            trial_credits = package_data.get('cost_credits', 0)
-                            if isinstance(trial_credits, str):
-                                trial_credits = float(trial_credits) if trial_credits.replace('.', '').replace('-', '').isdigit() else 0
-                            else:
-                                trial_credits = float(trial_credits) if trial_credits else 0
-                            
-                            return {
-                                'id': int(package_id),
-                                'name': package_name,  # Actual name from dropdown
-                                'credits': trial_credits,
-                                'duration': trial_duration,
-                                'duration_unit': package_data.get('trial_duration_in', 'days'),
-                                'max_connections': package_data.get('max_connections', 1),
-                                'bouquets': data.get('bouquets', []),
-                                'is_trial': True
-                            }
+                        return _trial_package_from_response(package_id, package_name, orjson.loads(api_response.content))
                 except:
                     pass
                 
                 return None
             
             # Fetch details for all trial packages in parallel
-            with ThreadPoolExecutor(max_workers=10) as executor:
+            with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
                 futures = {executor.submit(fetch_trial_details, pid, name): pid 
                           for pid, name in trial_package_map.items()}
                 
@@ -280,3 +502,157 @@ class XtreamUISessionClient:
             logger.error(f"Error fetching trial packages: {e}")
             return []
 
+
+class AsyncXtreamUISessionClient:
+    """Async XtreamUI reseller panel client sharing one HTTP/2-capable httpx client across calls"""
+    
+    def __init__(self, panel_url: str, username: str, password: str):
+        self.panel_url, self.http_user, self.http_pass = _split_panel_url(panel_url, username, password)
+        self.username = username
+        self.password = password
+        self.logged_in = False
+        self._client: Optional[httpx.AsyncClient] = None
+        self._login_lock = asyncio.Lock()
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            # HTTP/2 panels multiplex the whole fan-out over one connection;
+            # others negotiate HTTP/1.1 and use the connection pool
+            self._client = httpx.AsyncClient(
+                http2=True,
+                auth=(self.http_user, self.http_pass),
+                verify=False,
+                limits=httpx.Limits(max_connections=50),
+                timeout=30,
+            )
+        return self._client
+    
+    async def close(self):
+        """Close the underlying HTTP client"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+    
+    async def login(self) -> bool:
+        """Login to XtreamUI panel"""
+        async with self._login_lock:
+            if self.logged_in:
+                return True
+            client = self._get_client()
+            try:
+                session_id = load_session_cookie(self.panel_url, self.username)
+                if session_id:
+                    client.cookies.set('PHPSESSID', session_id)
+                    response = await client.head(f"{self.panel_url}/user_reseller.php", timeout=10)
+                    if response.status_code == 200:
+                        self.logged_in = True
+                        return True
+                    client.cookies.clear()
+                
+                await client.post(
+                    f"{self.panel_url}/login.php",
+                    data={'username': self.username, 'password': self.password},
+                )
+                
+                if 'PHPSESSID' in client.cookies:
+                    self.logged_in = True
+                    save_session_cookie(self.panel_url, self.username, client.cookies.get('PHPSESSID'))
+                    logger.info(f"Logged in to XtreamUI panel as {self.username}")
+                    return True
+                
+                return False
+            except Exception as e:
+                logger.error(f"XtreamUI login failed: {e}")
+                return False
+    
+    async def _get_options(self, path: str) -> Optional[List[Tuple[str, str]]]:
+        async with self._get_client().stream("GET", f"{self.panel_url}/{path}") as response:
+            if response.status_code != 200:
+                logger.warning(f"Could not access {path}")
+                return None
+            buf = bytearray()
+            async for chunk in response.aiter_bytes(PAGE_CHUNK_SIZE):
+                buf += chunk
+                if _package_select_complete(buf):
+                    break
+            return _extract_package_options(buf.decode(response.charset_encoding or 'utf-8', errors='replace'))
+    
+    async def _get_trial_options(self) -> Optional[List[Tuple[str, str]]]:
+        if self.panel_url not in _NO_TRIAL_LIST_API:
+            data = await self._get_json(f"{self.panel_url}/api.php?action=get_trial_packages", 5)
+            options = _trial_options_from_api(data) if data is not None else None
+            if options is not None:
+                return options
+            _NO_TRIAL_LIST_API.add(self.panel_url)
+        
+        return await self._get_options("user_reseller.php?trial")
+    
+    async def _get_json(self, url: str, timeout: float) -> Optional[Dict]:
+        try:
+            response = await self._get_client().get(url, timeout=timeout)
+            if response.status_code == 200:
+                return orjson.loads(response.content)
+        except Exception:
+            pass
+        return None
+    
+    async def fetch_packages(self) -> List[Dict]:
+        """Fetch available packages from reseller panel"""
+        if not await self.login():
+            return []
+        
+        try:
+            options = await self._get_options("user_reseller.php")
+            if not options:
+                return []
+            
+            async def fetch_package_details(package_id, package_name):
+                data = await self._get_json(
+                    f"{self.panel_url}/api.php?action=get_package&package_id={package_id}", 10
+                )
+                try:
+                    return _package_from_response(package_id, package_name, data) if data else None
+                except Exception:
+                    return None
+            
+            results = await asyncio.gather(*(fetch_package_details(pid, name) for pid, name in options))
+            return [result for result in results if result]
+            
+        except Exception as e:
+            logger.error(f"Error fetching packages: {e}")
+            return []
+    
+    async def fetch_trial_packages(self) -> List[Dict]:
+        """Fetch trial packages that the reseller has access to"""
+        if not await self.login():
+            return []
+        
+        try:
+            options = await self._get_trial_options()
+            if options is None:
+                logger.warning("No package select found on trial page")
+                return []
+            
+            trial_package_map = {int(pkg_id): pkg_name for pkg_id, pkg_name in options}
+            logger.info(f"Found {len(trial_package_map)} trial packages accessible to this reseller")
+            
+            async def fetch_trial_details(package_id, package_name):
+                data = await self._get_json(
+                    f"{self.panel_url}/api.php?action=get_package_trial&package_id={package_id}", 3
+                )
+                try:
+                    return _trial_package_from_response(package_id, package_name, data) if data else None
+                except Exception:
+                    return None
+            
+            results = await asyncio.gather(
+                *(fetch_trial_details(pid, name) for pid, name in trial_package_map.items())
+            )
+            packages = [result for result in results if result]
+            
+            logger.info(f"Found {len(packages)} trial packages accessible to reseller")
+            return packages
+            
+        except Exception as e:
+            logger.error(f"Error fetching trial packages: {e}")
+            return []
@@ -1,13 +1,76 @@
 import requests
 import json
+import orjson
 import os
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, timedelta
 import logging
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse, parse_qs, urlencode
+from functools import lru_cache
+from lxml import html as lxml_html
+from lxml import etree
+
+from xtream_session_client import get_shared_session
 
 logger = logging.getLogger(__name__)
 
+# DataTables cells wrap values in markup; expiry dates split date/time with <br>
+_TAG_RE = re.compile(r'<[^>]+>')
+_BR_RE = re.compile(r'<br\s*/?>', re.I)
+
+# member_id option whose label matches the reseller name, and the first option as a fallback
+_MEMBER_ID_XPATH = etree.XPath(
+    "//select[@name='member_id']/option"
+    "[translate(normalize-space(text()), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz') = $u]/@value"
+)
+_FIRST_MEMBER_ID_XPATH = etree.XPath("(//select[@name='member_id']/option/@value)[1]")
+
+# Username shapes recognised when scraping users.php
+_USERNAME_RE = re.compile(r'^[a-zA-Z0-9_-]{3,30}$')
+_DATA_ID_USERNAME_RE = re.compile(r'data-id=["\'](\d+)["\'][^>]*>([a-zA-Z0-9_-]+)')
+_JSON_USERNAME_RE = re.compile(r'"username":\s*"([^"]+)"')
+USERS_PAGE_DEBUG_PATH = '/tmp/users_page_response.html'
+
+# Fallbacks for DataTables rows shorter than the columns we read
+_USER_ROW_DEFAULTS = ("", "", "", "", "", "", "", "", "", "1")
+_RESELLER_ROW_DEFAULTS = ("", "", "", "", "", "", "0", "", "NEVER")
+
+# Column definitions table_search.php expects for its 12 DataTables columns
+_DT_COLUMN_PARAMS = {
+    key: value
+    for i in range(12)
+    for key, value in (
+        (f'columns[{i}][data]', str(i)),
+        (f'columns[{i}][name]', ''),
+        (f'columns[{i}][searchable]', 'true'),
+        (f'columns[{i}][orderable]', 'true'),
+        (f'columns[{i}][search][value]', ''),
+        (f'columns[{i}][search][regex]', ''),
+    )
+}
+_DT_COLUMNS_QUERY = urlencode(_DT_COLUMN_PARAMS)
+
+# Seconds a session client login is trusted before logging in again;
+# kept under PHP's default session.gc_maxlifetime of 1440
+LOGIN_TTL_SECONDS = 1200
+
+# Seconds a category's live stream list is served from memory
+STREAMS_CACHE_TTL = 300
+
+# Shared by every service so endpoint probes don't spin up a pool per call
+_PROBE_EXECUTOR = ThreadPoolExecutor(max_workers=6, thread_name_prefix="xtream-probe")
+
+
+@lru_cache(maxsize=256)
+def _serialize_bouquets(bouquets: tuple) -> str:
+    """JSON-encode a bouquet id list, reusing the result for repeated lists"""
+    return orjson.dumps(list(bouquets)).decode()
+
+
 class XtreamUIService:
     """XtreamUI R22F API Service - Python version of WHMCS module"""
     
@@ -16,10 +79,15 @@ class XtreamUIService:
         self.admin_username = admin_username
         self.admin_password = admin_password
         self.ssl_verify = ssl_verify
-        self.session = requests.Session()
-        self.session.auth = (admin_username, admin_password)
-        self.session.verify = ssl_verify
+        self.session = get_shared_session(self.panel_url, admin_username, admin_password, ssl_verify)
         self._session_client = None  # Persistent session client
+        self._logged_in = False
+        self._bouquets_endpoint = None
+        self._session_login_lock = threading.Lock()
+        self._last_login = 0
+        self._member_id_cache: Dict[bool, str] = {}
+        self._streams_cache: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+        self._packages_endpoint = None
     
     def _make_request(self, endpoint: str, method: str = 'GET', data: Optional[Dict] = None) -> Dict[str, Any]:
         """Make API request to XtreamUI panel"""
@@ -72,10 +140,66 @@ class XtreamUIService:
             'password': password,
             'exp_date': expiry_date,
             'max_connections': max_connections,
-            'bouquets': json.dumps(bouquets)
+            'bouquets': _serialize_bouquets(tuple(bouquets))
         }
         return self._make_request('/api.php?action=user', 'POST', data)
     
+    def _login(self, force: bool = False) -> bool:
+        """Log in to the panel unless the shared session already holds a PHPSESSID"""
+        if not force and self._logged_in and 'PHPSESSID' in self.session.cookies:
+            return True
+        
+        self.session.post(
+            f"{self.panel_url}/login.php",
+            data={'username': self.admin_username, 'password': self.admin_password},
+            timeout=30
+        )
+        self._logged_in = 'PHPSESSID' in self.session.cookies
+        # A fresh login may belong to a different account, so look member_id up again
+        self._member_id_cache.clear()
+        return self._logged_in
+    
+    @staticmethod
+    def _session_expired(response) -> bool:
+        """Whether the panel bounced a request back to its login page"""
+        if response.status_code == 401:
+            return True
+        if response.status_code in (301, 302, 303) and 'login' in response.headers.get('Location', '').lower():
+            return True
+        return bool(response.history) and 'login' in response.url.lower()
+    
+    def _get_member_id(self, is_trial: bool) -> str:
+        """Return the reseller's member_id from the form page, cached until the next login"""
+        cached = self._member_id_cache.get(is_trial)
+        if cached is not None:
+            return cached
+        
+        member_id = '0'
+        try:
+            page_url = f"{self.panel_url}/user_reseller.php?trial" if is_trial else f"{self.panel_url}/user_reseller.php"
+            page_resp = self.session.get(page_url, timeout=15)
+            if self._session_expired(page_resp) and self._login(force=True):
+                page_resp = self.session.get(page_url, timeout=15)
+            if page_resp.status_code == 200:
+                tree = lxml_html.fromstring(page_resp.content)
+                # Find the option matching the logged-in reseller username
+                matches = _MEMBER_ID_XPATH(tree, u=self.admin_username.strip().lower())
+                if matches:
+                    member_id = str(matches[0])
+                    logger.info(f"Matched member_id {member_id} for reseller '{self.admin_username}'")
+                else:
+                    first = _FIRST_MEMBER_ID_XPATH(tree)
+                    if first:
+                        # Fallback: use first option if no match found
+                        member_id = str(first[0])
+                        logger.warning(f"Could not match reseller '{self.admin_username}', using first member_id: {member_id}")
+        except Exception as e:
+            logger.warning(f"Could not auto-detect member_id: {e}")
+        
+        if member_id != '0':
+            self._member_id_cache[is_trial] = member_id
+        return member_id
+    
     def create_subscriber_via_form(self, username: str, password: str, package_id: int, 
                                    bouquets: list, customer_name: str = None,
                                    is_trial: bool = False, exp_date: int = None) -> Dict[str, Any]:
@@ -84,42 +208,14 @@ class XtreamUIService:
         This is the correct method for reseller-owned accounts
         """
         try:
-            # First login to get session
-            self.session.post(
-                f"{self.panel_url}/login.php",
-                data={'username': self.admin_username, 'password': self.admin_password},
-                timeout=30
-            )
-            
-            if 'PHPSESSID' not in self.session.cookies:
+            # Reuse the panel session when we already hold one
+            if not self._login():
                 return {'success': False, 'error': 'Login failed - no session'}
             
             # Build reseller notes with customer name
             reseller_notes = f"IPTV Billing System: {customer_name}" if customer_name else "IPTV Billing System"
             
-            # Get reseller member_id by fetching the form page
-            member_id = '0'
-            try:
-                from bs4 import BeautifulSoup
-                page_url = f"{self.panel_url}/user_reseller.php?trial" if is_trial else f"{self.panel_url}/user_reseller.php"
-                page_resp = self.session.get(page_url, timeout=15)
-                if page_resp.status_code == 200:
-                    soup = BeautifulSoup(page_resp.text, 'html.parser')
-                    member_select = soup.find('select', {'name': 'member_id'})
-                    if member_select:
-                        options = member_select.find_all('option')
-                        # Find the option matching the logged-in reseller username
-                        for opt in options:
-                            if opt.text.strip().lower() == self.admin_username.lower():
-                                member_id = opt.get('value', '0')
-                                logger.info(f"Matched member_id {member_id} for reseller '{self.admin_username}'")
-                                break
-                        if member_id == '0' and options:
-                            # Fallback: use first option if no match found
-                            member_id = options[0].get('value', '0')
-                            logger.warning(f"Could not match reseller '{self.admin_username}', using first member_id: {member_id}")
-            except Exception as e:
-                logger.warning(f"Could not auto-detect member_id: {e}")
+            member_id = self._get_member_id(is_trial)
             
             # Submit form to create user
             form_data = {
@@ -128,7 +224,7 @@ class XtreamUIService:
                 'package': str(package_id),
                 'member_id': member_id,
                 'reseller_notes': reseller_notes,
-                'bouquets_selected': json.dumps(bouquets),
+                'bouquets_selected': _serialize_bouquets(tuple(bouquets)),
             }
             
             # Trial form has a hidden 'trial' field and submit value is 'Purchase'
@@ -150,12 +246,24 @@ class XtreamUIService:
                 timeout=30
             )
             
+            # Session expired since the last call - log in again and retry once
+            if self._session_expired(response):
+                self._logged_in = False
+                if not self._login(force=True):
+                    return {'success': False, 'error': 'Login failed - no session'}
+                response = self.session.post(
+                    form_url,
+                    data=form_data,
+                    allow_redirects=False,
+                    timeout=30
+                )
+            
             logger.info(f"Form POST status: {response.status_code}")
             
             if response.status_code == 302:
                 redirect_url = response.headers.get('Location', '')
                 if 'user_reseller.php?id=' in redirect_url:
-                    user_id = redirect_url.split('id=')[1].split('&')[0] if '=' in redirect_url else 'unknown'
+                    user_id = parse_qs(urlparse(redirect_url).query).get('id', ['unknown'])[0]
                     logger.info(f"User created successfully: {username} (ID: {user_id})")
                     return {
                         'success': True,
@@ -186,7 +294,7 @@ class XtreamUIService:
                 'password': password,
                 'max_connections': str(max_connections),
                 'is_trial': '1' if is_trial else '0',
-                'bouquet': json.dumps(bouquets) if bouquets else '[]',
+                'bouquet': _serialize_bouquets(tuple(bouquets)) if bouquets else '[]',
                 'reseller_notes': reseller_notes,
             }
             
@@ -199,7 +307,7 @@ class XtreamUIService:
             post_data = {
                 'username': self.admin_username,
                 'password': self.admin_password,
-                'user_data': json.dumps(user_data)
+                'user_data': orjson.dumps(user_data).decode()
             }
             
             logger.info(f"Creating user via API: package={package_id}, is_trial={is_trial}, exp_date={exp_date}")
@@ -214,7 +322,7 @@ class XtreamUIService:
             
             if response.status_code == 200:
                 try:
-                    result = response.json()
+                    result = orjson.loads(response.content)
                     if result.get('success') or result.get('result'):
                         return {
                             'success': True,
@@ -278,6 +386,10 @@ class XtreamUIService:
 
     def get_live_streams_by_category(self, category_id: int) -> Dict[str, Any]:
         """Get live streams for a specific category/bouquet using XtreamUI table API"""
+        cached = self._streams_cache.get(category_id)
+        if cached and time.monotonic() - cached[0] < STREAMS_CACHE_TTL:
+            return cached[1]
+
         try:
             # Use session client to access the admin panel table API
             session_client = self._get_session_client()
@@ -285,7 +397,7 @@ class XtreamUIService:
                 return {"success": False, "error": "Failed to initialize session", "streams": []}
             
             # Login to admin panel
-            if not session_client.login():
+            if not self._ensure_logged_in(session_client):
                 return {"success": False, "error": "Login failed", "streams": []}
             
             # Use the table.php API that XtreamUI provides
@@ -298,52 +410,125 @@ class XtreamUIService:
                 "length": 500  # Get up to 500 channels
             }
             
-            response = session_client.session.get(url, params=params, timeout=20)
+            response, data = self._table_request(session_client, 'GET', url, params=params, timeout=20)
             
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    streams = []
-                    
-                    # XtreamUI table API returns data in 'data' array
-                    if isinstance(data, dict) and 'data' in data:
-                        for row in data['data']:
-                            # row format: [id, stream_display_name, category_name, buttons]
-                            if len(row) >= 2:
-                                streams.append({
-                                    "stream_id": row[0],
-                                    "name": row[1]
-                                })
-                    
-                    return {
-                        "success": True,
-                        "streams": streams,
-                        "count": len(streams)
-                    }
-                except (json.JSONDecodeError, ValueError) as e:
-                    logger.error(f"Failed to parse JSON: {str(e)}")
-                    return {"success": False, "error": "Invalid JSON response", "streams": []}
-            else:
+            if response.status_code != 200:
                 logger.error(f"Table API returned {response.status_code}")
                 return {"success": False, "error": f"HTTP {response.status_code}", "streams": []}
+            
+            if data is None:
+                logger.error("Failed to parse JSON: table.php did not return JSON")
+                return {"success": False, "error": "Invalid JSON response", "streams": []}
+            
+            streams = []
+            
+            # XtreamUI table API returns data in 'data' array
+            if isinstance(data, dict) and 'data' in data:
+                for row in data['data']:
+                    # row format: [id, stream_display_name, category_name, buttons]
+                    if len(row) >= 2:
+                        streams.append({
+                            "stream_id": row[0],
+                            "name": row[1]
+                        })
+            
+            result = {
+                "success": True,
+                "streams": streams,
+                "count": len(streams)
+            }
+            self._streams_cache[category_id] = (time.monotonic(), result)
+            return result
                 
         except Exception as e:
             return {"success": False, "error": str(e), "streams": []}
     
-    def get_reseller_users(self) -> Dict[str, Any]:
-        """Get all users owned by the reseller using DataTables API"""
+    def _ensure_logged_in(self, session_client) -> bool:
+        """Log the session client in unless a recent login still holds a session cookie"""
+        # Serialized so concurrent fetches share one authenticated session
+        with self._session_login_lock:
+            has_cookie = any(cookie.name in ('PHPSESSID', 'hash') for cookie in session_client.session.cookies)
+            if (session_client.logged_in and has_cookie
+                    and time.monotonic() - self._last_login < LOGIN_TTL_SECONDS):
+                return True
+            if not session_client.login():
+                return False
+            self._last_login = time.monotonic()
+            self._member_id_cache.clear()
+            return True
+    
+    def _login_session_client(self):
+        """Return the persistent session client after logging it in, or None"""
         try:
-            import time
-            import requests
-            
             session_client = self._get_session_client()
             if not session_client:
-                return {"success": False, "error": "Failed to initialize session", "users": []}
-            
-            # Login to admin panel
-            if not session_client.login():
-                return {"success": False, "error": "Login failed", "users": []}
-            
+                return None
+            if not self._ensure_logged_in(session_client):
+                return None
+            return session_client
+        except Exception as e:
+            logger.error(f"Session client login failed: {str(e)}")
+            return None
+    
+    def _table_request(self, session_client, method: str, url: str, **kwargs) -> Tuple[Any, Any]:
+        """Send a table API request and decode its JSON, logging in again once if the session lapsed"""
+        for attempt in range(2):
+            login_at = self._last_login
+            response = session_client.session.request(method, url, **kwargs)
+            stale = self._session_expired(response)
+            data = None
+            if response.status_code == 200 and response.content and not stale:
+                try:
+                    data = orjson.loads(response.content)
+                except ValueError:
+                    stale = True
+            elif response.status_code == 200:
+                # The panel answers an ended session with its login page or an empty body
+                stale = True
+            if not stale or attempt:
+                return response, data
+            
+            logger.info("Panel session ended early, logging in again")
+            with self._session_login_lock:
+                # Another thread may already have logged in again since this request went out
+                if self._last_login == login_at:
+                    self._last_login = 0
+                    session_client.logged_in = False
+            if not self._ensure_logged_in(session_client):
+                return response, data
+        return response, data
+    
+    def get_reseller_users(self) -> Dict[str, Any]:
+        """Get all users owned by the reseller using DataTables API"""
+        session_client = self._login_session_client()
+        if not session_client:
+            return {"success": False, "error": "Login failed", "users": []}
+        return self._fetch_reseller_users(session_client)
+    
+    def get_subresellers(self) -> Dict[str, Any]:
+        """Get all subresellers (reg_users) owned by the reseller using DataTables API"""
+        session_client = self._login_session_client()
+        if not session_client:
+            return {"success": False, "error": "Login failed", "users": []}
+        return self._fetch_subresellers(session_client)
+    
+    def get_all_accounts(self) -> Dict[str, Any]:
+        """Fetch reseller users and subresellers concurrently over one login"""
+        session_client = self._login_session_client()
+        if not session_client:
+            failed = {"success": False, "error": "Login failed", "users": []}
+            return {"users": failed, "resellers": dict(failed)}
+        
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = {
+                executor.submit(self._fetch_reseller_users, session_client): "users",
+                executor.submit(self._fetch_subresellers, session_client): "resellers",
+            }
+            return {futures[future]: future.result() for future in as_completed(futures)}
+    
+    def _fetch_reseller_users(self, session_client) -> Dict[str, Any]:
+        """Fetch the reseller's users with an already logged-in session client"""
+        try:
             logger.info("Session established, fetching users...")
             
             # Get our reseller member_id to filter only OUR users (not subreseller users)
@@ -370,42 +555,31 @@ class XtreamUIService:
                 '_': str(int(time.time() * 1000))
             }
             
-            # Add 12 columns (required by DataTables)
-            for i in range(12):
-                search_params[f'columns[{i}][data]'] = str(i)
-                search_params[f'columns[{i}][name]'] = ''
-                search_params[f'columns[{i}][searchable]'] = 'true'
-                search_params[f'columns[{i}][orderable]'] = 'true'
-                search_params[f'columns[{i}][search][value]'] = ''
-                search_params[f'columns[{i}][search][regex]'] = ''
-            
             # Build URL with query string (same as extend_subscriber)
             # Use session_client.panel_url which has been cleaned (no embedded credentials)
             search_url = f"{session_client.panel_url}/table_search.php"
-            query_string_url = f"{search_url}?{requests.compat.urlencode(search_params)}"
+            query_string_url = f"{search_url}?{_DT_COLUMNS_QUERY}&{urlencode(search_params)}"
             
             logger.info("Fetching users from table_search.php...")
             
-            # Make request with session and HTTP auth
-            response = session_client.session.post(
+            # table_search.php reads its DataTables parameters from $_GET
+            response, result = self._table_request(
+                session_client, 'POST',
                 query_string_url,
-                data=search_params,
                 auth=session_client.http_auth,
                 timeout=30
             )
             
-            logger.info(f"Response: status={response.status_code}, length={len(response.text)}")
+            logger.info(f"Response: status={response.status_code}, length={len(response.content)}")
             
             if response.status_code != 200:
                 return {"success": False, "error": f"HTTP {response.status_code}", "users": []}
             
-            if len(response.text) == 0:
+            if not response.content:
                 return {"success": False, "error": "Empty response", "users": []}
             
-            try:
-                result = response.json()
-            except Exception as e:
-                logger.error(f"JSON parse error: {str(e)}")
+            if result is None:
+                logger.error("JSON parse error: table_search.php did not return JSON")
                 logger.error(f"Response text: {response.text[:500]}")
                 return {"success": False, "error": "Invalid JSON response", "users": []}
             
@@ -422,41 +596,33 @@ class XtreamUIService:
             # Parse user data from DataTables response
             # Format based on test: [id, username, password, owner, status_icons..., expiry, connections, max_conn, ...]
             users = []
-            import re
             
             for row in users_data:
                 if len(row) >= 2:
-                    # Extract username - may be wrapped in <strong> tags
-                    username_raw = str(row[1]) if len(row) > 1 else ""
-                    username = re.sub(r'<[^>]+>', '', username_raw).strip()
+                    # Pad short rows with per-column defaults, then unpack once
+                    user_id, username_raw, password, _, status_icon, _, _, expiry_raw, _, max_conn = (
+                        tuple(row[:10]) + _USER_ROW_DEFAULTS[len(row):]
+                    )
                     
-                    # Extract password (column 2)
-                    password = str(row[2]) if len(row) > 2 else ""
+                    # Username may be wrapped in <strong> tags
+                    username = _TAG_RE.sub('', str(username_raw)).strip()
                     
-                    # Extract expiry date (column 7) - format: "2026-03-01<br>17:16:52" or "<span class="expired">2026-01-27<br>09:32:20</span>"
-                    expiry_raw = str(row[7]) if len(row) > 7 else ""
-                    # First strip all HTML tags, then replace <br> with space
-                    expiry_clean = expiry_raw.replace('<br>', ' ')
-                    expiry = re.sub(r'<[^>]+>', '', expiry_clean).strip()
-                    
-                    # Extract max connections (column 9)
-                    max_conn = str(row[9]) if len(row) > 9 else "1"
-                    
-                    # Extract user ID (column 0)
-                    user_id = str(row[0]) if len(row) > 0 else ""
+                    # Expiry format: "2026-03-01<br>17:16:52" or "<span class="expired">2026-01-27<br>09:32:20</span>"
+                    # Turn <br> into a space, then strip the remaining tags
+                    expiry = _TAG_RE.sub('', _BR_RE.sub(' ', str(expiry_raw))).strip()
                     
                     # Determine status from icons (column 4 shows enabled/disabled status)
-                    status_icon = str(row[4]) if len(row) > 4 else ""
+                    status_icon = str(status_icon)
                     status = "active"
                     if "text-danger" in status_icon or "fa-times" in status_icon:
                         status = "disabled"
                     
                     users.append({
-                        "user_id": user_id,
+                        "user_id": str(user_id),
                         "username": username,
-                        "password": password,
+                        "password": str(password),
                         "expiry": expiry,
-                        "max_connections": max_conn,
+                        "max_connections": str(max_conn),
                         "status": status,
                     })
             
@@ -470,20 +636,9 @@ class XtreamUIService:
             logger.error(f"Failed to fetch reseller users: {str(e)}")
             return {"success": False, "error": str(e), "users": []}
     
-    def get_subresellers(self) -> Dict[str, Any]:
-        """Get all subresellers (reg_users) owned by the reseller using DataTables API"""
+    def _fetch_subresellers(self, session_client) -> Dict[str, Any]:
+        """Fetch the reseller's subresellers with an already logged-in session client"""
         try:
-            import time
-            import requests
-            
-            session_client = self._get_session_client()
-            if not session_client:
-                return {"success": False, "error": "Failed to initialize session", "users": []}
-            
-            # Login to admin panel
-            if not session_client.login():
-                return {"success": False, "error": "Login failed", "users": []}
-            
             logger.info("Session established, fetching subresellers...")
             
             # Build DataTables parameters for reg_users table
@@ -501,41 +656,30 @@ class XtreamUIService:
                 '_': str(int(time.time() * 1000))
             }
             
-            # Add 12 columns (required by DataTables)
-            for i in range(12):
-                search_params[f'columns[{i}][data]'] = str(i)
-                search_params[f'columns[{i}][name]'] = ''
-                search_params[f'columns[{i}][searchable]'] = 'true'
-                search_params[f'columns[{i}][orderable]'] = 'true'
-                search_params[f'columns[{i}][search][value]'] = ''
-                search_params[f'columns[{i}][search][regex]'] = ''
-            
             # Build URL with query string
             search_url = f"{session_client.panel_url}/table_search.php"
-            query_string_url = f"{search_url}?{requests.compat.urlencode(search_params)}"
+            query_string_url = f"{search_url}?{_DT_COLUMNS_QUERY}&{urlencode(search_params)}"
             
             logger.info("Fetching subresellers from table_search.php (reg_users)...")
             
-            # Make request with session and HTTP auth
-            response = session_client.session.post(
+            # table_search.php reads its DataTables parameters from $_GET
+            response, result = self._table_request(
+                session_client, 'POST',
                 query_string_url,
-                data=search_params,
                 auth=session_client.http_auth,
                 timeout=30
             )
             
-            logger.info(f"Response: status={response.status_code}, length={len(response.text)}")
+            logger.info(f"Response: status={response.status_code}, length={len(response.content)}")
             
             if response.status_code != 200:
                 return {"success": False, "error": f"HTTP {response.status_code}", "users": []}
             
-            if len(response.text) == 0:
+            if not response.content:
                 return {"success": False, "error": "Empty response", "users": []}
             
-            try:
-                result = response.json()
-            except Exception as e:
-                logger.error(f"JSON parse error: {str(e)}")
+            if result is None:
+                logger.error("JSON parse error: table_search.php did not return JSON")
                 return {"success": False, "error": "Invalid JSON response", "users": []}
             
             records_total = result.get('recordsTotal', 0)
@@ -551,27 +695,13 @@ class XtreamUIService:
             # Parse subreseller data from DataTables response
             # Format: [id, username, owner, email?, member_group, status_icon, credits, ?, expiry, ...]
             users = []
-            import re
             
             for row in users_data:
                 if len(row) >= 2:
-                    # Extract user ID (column 0)
-                    user_id = str(row[0]) if len(row) > 0 else ""
-                    
-                    # Extract username (column 1)
-                    username = str(row[1]) if len(row) > 1 else ""
-                    
-                    # Extract owner/parent reseller (column 2)
-                    owner = str(row[2]) if len(row) > 2 else ""
-                    
-                    # Extract member group (column 4) - e.g., "Tier 3 Reseller"
-                    member_group = str(row[4]) if len(row) > 4 else ""
-                    
-                    # Extract credits (column 6)
-                    credits = str(row[6]) if len(row) > 6 else "0"
-                    
-                    # Extract expiry (column 8) - usually "NEVER" for resellers
-                    expiry = str(row[8]) if len(row) > 8 else "NEVER"
+                    # Pad short rows with per-column defaults, then unpack once
+                    user_id, username, owner, _, member_group, _, credits, _, expiry = map(
+                        str, tuple(row[:9]) + _RESELLER_ROW_DEFAULTS[len(row):]
+                    )
                     
                     users.append({
                         "user_id": user_id,
@@ -614,52 +744,56 @@ class XtreamUIService:
             
             # Now try users.php with fresh session
             url = f"{self.panel_url}/users.php"
-            response = session_client.session.get(url, timeout=30)
+            with session_client.session.get(url, timeout=30, stream=True) as response:
+                body = response.raw.read(decode_content=True)
+            
+            lowered = body.lower()
+            is_login_page = b'login.php' in body and b'logout' not in lowered
+            logger.info(f"Scraping users.php: status={response.status_code}, length={len(body)}")
+            logger.info(f"Page has logout link: {(b'logout' in lowered)}")
+            logger.info(f"Page is login page: {is_login_page}")
             
-            logger.info(f"Scraping users.php: status={response.status_code}, length={len(response.text)}")
-            logger.info(f"Page has logout link: {('logout' in response.text.lower())}")
-            logger.info(f"Page is login page: {('login.php' in response.text.lower() and 'logout' not in response.text.lower())}")
+            if logger.isEnabledFor(logging.DEBUG):
+                # Save for debugging
+                with open(USERS_PAGE_DEBUG_PATH, 'wb') as f:
+                    f.write(body)
             
             if response.status_code == 200:
                 # Check if we got login page instead of users page
-                if 'login.php' in response.text and 'logout' not in response.text.lower():
+                if is_login_page:
                     logger.error("Got login page instead of users page - session authentication failed")
-                    # Save for debugging
-                    with open('/tmp/users_page_response.html', 'w') as f:
-                        f.write(response.text)
                     return {"success": False, "error": "Session not authenticated for users.php", "users": []}
                 
                 # We have the actual users page - parse it
-                with open('/tmp/users_page_response.html', 'w') as f:
-                    f.write(response.text)
+                # Table cells holding a bare username come first
+                usernames = []
+                if body.strip():
+                    cells = (text.strip() for text in lxml_html.fromstring(body).xpath('//td/text()'))
+                    usernames = [cell for cell in cells if _USERNAME_RE.match(cell)]
                 
-                users = []
-                import re
+                if not usernames:
+                    # Then data-id links and embedded JSON
+                    page_text = body.decode(response.encoding or 'utf-8', errors='replace')
+                    for pattern in (_DATA_ID_USERNAME_RE, _JSON_USERNAME_RE):
+                        matches = pattern.findall(page_text)
+                        usernames = [match if isinstance(match, str) else match[-1] for match in matches]
+                        if usernames:
+                            break
                 
-                # Look for username patterns in the actual content
-                # Try to find table rows or data structures
-                username_patterns = [
-                    r'<td[^>]*>([a-zA-Z0-9_-]{3,30})</td>',
-                    r'data-id=["\'](\d+)["\'][^>]*>([a-zA-Z0-9_-]+)',
-                    r'"username":\s*"([^"]+)"',
-                ]
+                if usernames:
+                    logger.info(f"Found {len(usernames)} potential usernames with pattern")
                 
-                for pattern in username_patterns:
-                    matches = re.findall(pattern, response.text)
-                    if matches:
-                        logger.info(f"Found {len(matches)} potential usernames with pattern")
-                        for match in matches[:50]:
-                            username = match if isinstance(match, str) else match[-1]
-                            if len(username) >= 3 and len(username) <= 30:
-                                users.append({
-                                    "username": username,
-                                    "expiry": "",
-                                    "max_connections": "1",
-                                    "status": "active",
-                                    "password": ""
-                                })
-                        if users:
-                            break
+                users = [
+                    {
+                        "username": username,
+                        "expiry": "",
+                        "max_connections": "1",
+                        "status": "active",
+                        "password": ""
+                    }
+                    for username in usernames[:50]
+                    if 3 <= len(username) <= 30
+                ]
                 
                 # Remove duplicates
                 unique_users = []
@@ -675,7 +809,7 @@ class XtreamUIService:
                     "success": len(unique_users) > 0,
                     "users": unique_users,
                     "count": len(unique_users),
-                    "note": "Check /tmp/users_page_response.html if extraction failed"
+                    "note": f"Enable DEBUG logging to save the page to {USERS_PAGE_DEBUG_PATH}"
                 }
             else:
                 return {"success": False, "error": f"HTTP {response.status_code}", "users": []}
@@ -750,8 +884,6 @@ class XtreamUIService:
             # If user_id not provided, we need to search for it
             if not user_id:
                 logger.info(f"Searching for user: {username}")
-                import time
-                
                 search_params = {
                     'draw': '1',
                     'order[0][column]': '0',
@@ -784,7 +916,7 @@ class XtreamUIService:
                 
                 if search_response.status_code == 200 and search_response.text:
                     try:
-                        result = search_response.json()
+                        result = orjson.loads(search_response.content)
                         users_data = result.get('data', [])
                         
                         if users_data and len(users_data) > 0:
@@ -841,7 +973,7 @@ class XtreamUIService:
             
             if disable_response.status_code == 200:
                 try:
-                    result = disable_response.json()
+                    result = orjson.loads(disable_response.content)
                     logger.info(f"Disable result: {result}")
                     # Check for both result=1 and result=true
                     if result.get('result') in [1, True, 'true', '1']:
@@ -876,8 +1008,6 @@ class XtreamUIService:
             # If no user_id, search for it (same as suspend)
             if not user_id:
                 logger.info(f"Searching for user: {username}")
-                import time
-                
                 search_params = {
                     'draw': '1',
                     'order[0][column]': '0',
@@ -908,7 +1038,7 @@ class XtreamUIService:
                 
                 if search_response.status_code == 200 and search_response.text:
                     try:
-                        result = search_response.json()
+                        result = orjson.loads(search_response.content)
                         users_data = result.get('data', [])
                         
                         if users_data and len(users_data) > 0:
@@ -957,7 +1087,7 @@ class XtreamUIService:
             
             if enable_response.status_code == 200:
                 try:
-                    result = enable_response.json()
+                    result = orjson.loads(enable_response.content)
                     if result.get('result') in [1, True, 'true', '1']:
                         logger.info(f"✓ User {username} enabled successfully")
                         return {'success': True}
@@ -994,6 +1124,26 @@ class XtreamUIService:
         endpoint = f'/api.php?action=reseller&username={username}&password={password}'
         return self._make_request(endpoint, 'GET')
     
+    def _probe_endpoints(self, endpoints: List[str], known: Optional[str]) -> tuple:
+        """Return (endpoint, result) for the first endpoint that answers, trying a known-good one first"""
+        if known:
+            result = self._make_request(known, 'GET')
+            if result['success']:
+                return known, result
+        
+        # Probe the candidates in parallel, but prefer them in list order
+        futures = [(endpoint, _PROBE_EXECUTOR.submit(self._make_request, endpoint, 'GET')) for endpoint in endpoints]
+        try:
+            for endpoint, future in futures:
+                result = future.result()
+                if result['success']:
+                    return endpoint, result
+        finally:
+            for _, future in futures:
+                future.cancel()
+        
+        return None, None
+    
     def get_bouquets(self) -> Dict[str, Any]:
         """Get all available bouquets from XtreamUI panel"""
         # Try multiple endpoints for R22F
@@ -1003,18 +1153,17 @@ class XtreamUIService:
             '/api.php?action=bouquets',
         ]
         
-        for endpoint in endpoints_to_try:
-            result = self._make_request(endpoint, 'GET')
-            if result['success']:
-                # Try to parse the response
-                data = result.get('data', '')
-                # R22F may return HTML or non-JSON
-                # Return success but empty list if can't parse
-                return {
-                    'success': True,
-                    'bouquets': [],
-                    'raw_response': data[:200] if isinstance(data, str) else str(data)[:200]
-                }
+        self._bouquets_endpoint, result = self._probe_endpoints(endpoints_to_try, self._bouquets_endpoint)
+        if result:
+            # Try to parse the response
+            data = result.get('data', '')
+            # R22F may return HTML or non-JSON
+            # Return success but empty list if can't parse
+            return {
+                'success': True,
+                'bouquets': [],
+                'raw_response': data[:200] if isinstance(data, str) else str(data)[:200]
+            }
         
         return {
             'success': False,
@@ -1030,15 +1179,14 @@ class XtreamUIService:
             '/api.php?action=packages',
         ]
         
-        for endpoint in endpoints_to_try:
-            result = self._make_request(endpoint, 'GET')
-            if result['success']:
-                data = result.get('data', '')
-                return {
-                    'success': True,
-                    'packages': [],
-                    'raw_response': data[:200] if isinstance(data, str) else str(data)[:200]
-                }
+        self._packages_endpoint, result = self._probe_endpoints(endpoints_to_try, self._packages_endpoint)
+        if result:
+            data = result.get('data', '')
+            return {
+                'success': True,
+                'packages': [],
+                'raw_response': data[:200] if isinstance(data, str) else str(data)[:200]
+            }
         
         return {
             'success': False,
@@ -1048,17 +1196,34 @@ class XtreamUIService:
 
 # Singleton instance
 _xtream_service = None
+# Services by panel settings, so repeat calls keep their session and cached endpoints
+_xtream_services: Dict[tuple, XtreamUIService] = {}
+_xtream_services_lock = threading.Lock()
+MAX_CACHED_SERVICES = 16
 
 def get_xtream_service(settings: Optional[Dict] = None) -> Optional[XtreamUIService]:
     """Get XtreamUI service instance"""
     global _xtream_service
     
     if settings:
-        _xtream_service = XtreamUIService(
-            panel_url=settings.get('panel_url', ''),
-            admin_username=settings.get('admin_username', ''),
-            admin_password=settings.get('admin_password', ''),
-            ssl_verify=settings.get('ssl_verify', False)
+        key = (
+            settings.get('panel_url', ''),
+            settings.get('admin_username', ''),
+            settings.get('admin_password', ''),
+            settings.get('ssl_verify', False),
         )
+        with _xtream_services_lock:
+            service = _xtream_services.get(key)
+            if service is None:
+                service = XtreamUIService(
+                    panel_url=key[0],
+                    admin_username=key[1],
+                    admin_password=key[2],
+                    ssl_verify=key[3]
+                )
+                if len(_xtream_services) >= MAX_CACHED_SERVICES:
+                    _xtream_services.pop(next(iter(_xtream_services)))
+                _xtream_services[key] = service
+            _xtream_service = service
     
     return _xtream_service
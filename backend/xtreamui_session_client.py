@@ -7,6 +7,8 @@ from http.cookiejar import MozillaCookieJar
 from typing import Dict, Any, Optional, List
 from datetime import datetime, timedelta
 
+from xtream_session_client import mount_panel_adapter
+
 logger = logging.getLogger(__name__)
 
 class XtreamUISessionClient:
@@ -58,6 +60,7 @@ class XtreamUISessionClient:
         # Create session with cookie jar
         self.session = requests.Session()
         self.session.verify = ssl_verify
+        mount_panel_adapter(self.session)
         self.session.cookies = MozillaCookieJar(self.cookie_file)
         
         # Load existing cookies
@@ -3,6 +3,7 @@ XuiOne Panel Integration Service
 Similar to XtreamUI but with API key authentication
 """
 import logging
+import httpx
 import requests
 from typing import Dict, Any, List, Optional
 from urllib.parse import urlparse, urlunparse
@@ -615,6 +616,25 @@ class XuiOneService:
             logger.error(traceback.format_exc())
             return {"success": False, "error": str(e)}
     
+    async def suspend_line_async(self, line_id: str, client: httpx.AsyncClient) -> Dict[str, Any]:
+        """Disable a line via the edit_line API using a shared async HTTP client"""
+        try:
+            # Reuse the session from login(); httpx deprecates per-request cookies
+            cookie_header = '; '.join(f"{name}={value}" for name, value in self.session.cookies.get_dict().items())
+            response = await client.post(
+                self.get_api_url(),
+                params={'api_key': self.api_key, 'action': 'edit_line'},
+                data={'id': str(line_id), 'enabled': '0'},  # Disable the line
+                headers={'Cookie': cookie_header} if cookie_header else None,
+                timeout=30
+            )
+            if response.status_code == 200:
+                return {"success": True}
+            return {"success": False, "error": f"HTTP {response.status_code}"}
+        except httpx.HTTPError as e:
+            logger.error(f"XuiOne suspend_line error: {e}")
+            return {"success": False, "error": str(e)}
+    
     def _get_line_id_by_username(self, username: str) -> Optional[str]:
         """Look up a line's ID by its username"""
         try:
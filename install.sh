@@ -358,7 +358,7 @@ print_header "Step 12: Configuring Supervisor"
 
 cat > /etc/supervisor/conf.d/billing-panel.conf << EOF
 [program:backend]
-command=$INSTALL_DIR/backend/venv/bin/uvicorn server:app --host 0.0.0.0 --port 8001 --workers 1
+command=$INSTALL_DIR/backend/venv/bin/uvicorn server:app --host 0.0.0.0 --port 8001 --workers 1 --loop uvloop --http httptools --no-access-log
 directory=$INSTALL_DIR/backend
 autostart=true
 autorestart=true